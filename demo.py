@@ -6,22 +6,23 @@ This script demonstrates the basic functionality of the chatbot.
 
 import os
 import sys
+import asyncio
+import importlib.util
 from pathlib import Path
 
 # Add the project root to the path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from thinkr_chatbot.core.chatbot import ThinkRChatbot
 
-
-def demo_chat():
+async def demo_chat():
     """Demo the chat functionality."""
     print("🤖 ThinkR Chatbot Demo")
     print("=" * 50)
     
     try:
-        # Initialize chatbot
+        # Initialize chatbot (imported here so the setup check stays fast)
         print("Initializing chatbot...")
+        from thinkr_chatbot.core.chatbot import ThinkRChatbot
         chatbot = ThinkRChatbot()
         
         # Show system info
@@ -43,27 +44,32 @@ def demo_chat():
         print("💬 Demo Questions:")
         print("-" * 30)
         
-        for i, question in enumerate(demo_questions, 1):
+        # The questions are independent, so send them all at once and let the
+        # OpenAI round-trips overlap instead of waiting on each one in turn.
+        async def ask(question):
+            return await asyncio.to_thread(chatbot.chat, question, use_context=True)
+        
+        print(f"🤔 Thinking about {len(demo_questions)} questions...")
+        results = await asyncio.gather(
+            *(ask(q) for q in demo_questions), return_exceptions=True
+        )
+        
+        for i, (question, result) in enumerate(zip(demo_questions, results), 1):
             print(f"\n{i}. {question}")
-            print("🤔 Thinking...")
             
-            try:
-                result = chatbot.chat(question, use_context=True)
+            if isinstance(result, Exception):
+                print(f"❌ Error processing question: {result}")
+            elif "error" in result:
+                print(f"❌ Error: {result['error']}")
+            else:
+                print("✅ Response generated!")
+                print(f"📝 Response: {result['response'][:200]}...")
                 
-                if "error" in result:
-                    print(f"❌ Error: {result['error']}")
-                else:
-                    print("✅ Response generated!")
-                    print(f"📝 Response: {result['response'][:200]}...")
-                    
-                    if result.get('references'):
-                        print(f"📚 References: {len(result['references'])} found")
-                    
-                    print(f"⏱️  Model: {result['model']}")
-                    print(f"🔗 Context used: {result['context_used']}")
+                if result.get('references'):
+                    print(f"📚 References: {len(result['references'])} found")
                 
-            except Exception as e:
-                print(f"❌ Error processing question: {e}")
+                print(f"⏱️  Model: {result['model']}")
+                print(f"🔗 Context used: {result['context_used']}")
             
             print("-" * 30)
         
@@ -130,28 +136,20 @@ def demo_setup():
         print("   ❌ Vector database directory not found")
         print("   💡 Create it with: mkdir -p data/vector_db")
     
-    # Check dependencies
+    # Check dependencies (only look them up, loading them takes seconds)
     print("\n3. Checking dependencies...")
-    try:
-        import openai
-        print("   ✅ OpenAI library available")
-    except ImportError:
-        print("   ❌ OpenAI library not found")
-        print("   💡 Install with: pip install openai")
+    dependencies = [
+        ("openai", "OpenAI library", "openai"),
+        ("faiss", "FAISS library", "faiss-cpu"),
+        ("sentence_transformers", "Sentence Transformers", "sentence-transformers"),
+    ]
     
-    try:
-        import faiss
-        print("   ✅ FAISS library available")
-    except ImportError:
-        print("   ❌ FAISS library not found")
-        print("   💡 Install with: pip install faiss-cpu")
-    
-    try:
-        import sentence_transformers
-        print("   ✅ Sentence Transformers available")
-    except ImportError:
-        print("   ❌ Sentence Transformers not found")
-        print("   💡 Install with: pip install sentence-transformers")
+    for module, label, package in dependencies:
+        if importlib.util.find_spec(module) is not None:
+            print(f"   ✅ {label} available")
+        else:
+            print(f"   ❌ {label} not found")
+            print(f"   💡 Install with: pip install {package}")
     
     print("\n✅ Setup check completed!")
 
@@ -170,7 +168,7 @@ def main():
     response = input("Continue with chat demo? (y/n): ").lower().strip()
     
     if response in ['y', 'yes']:
-        demo_chat()
+        asyncio.run(demo_chat())
     else:
         print("Demo ended. Run 'python demo.py' again to try the chat demo.")
 
@@ -0,0 +1,62 @@
+"""
+Setup script for the ThinkR chatbot.
+
+Set THINKR_USE_MYPYC=1 to compile the hot-path modules to C extensions with
+mypyc; without the flag the package installs as pure Python. mypyc has to be
+importable at build time, so install mypy first and build without isolation:
+
+    pip install "mypy>=1.8.0"
+    THINKR_USE_MYPYC=1 pip install --no-build-isolation -e .
+"""
+
+import os
+from pathlib import Path
+
+from setuptools import setup, find_packages
+
+# Modules compiled with mypyc when it is available
+MYPYC_MODULES = [
+    "thinkr_chatbot/core/prompt_manager.py",
+]
+
+ext_modules = []
+if os.getenv("THINKR_USE_MYPYC", "0") == "1":
+    try:
+        from mypyc.build import mypycify
+    except ImportError as e:
+        raise RuntimeError(
+            "THINKR_USE_MYPYC=1 but mypyc is not importable; install mypy and run pip with "
+            "--no-build-isolation (or unset THINKR_USE_MYPYC for a pure-Python install)"
+        ) from e
+    ext_modules = mypycify(MYPYC_MODULES, opt_level="3")
+
+# Requirement lines may carry a trailing "# ..." comment
+requirements = [
+    line.split("#", 1)[0].strip()
+    for line in Path(__file__).with_name("requirements.txt").read_text().splitlines()
+    if line.split("#", 1)[0].strip()
+]
+
+setup(
+    name="thinkr-chatbot",
+    version="0.1.0",
+    description="A friendly R tutor chatbot for ThinkR course materials",
+    long_description=Path(__file__).with_name("README.md").read_text(encoding="utf-8"),
+    long_description_content_type="text/markdown",
+    packages=find_packages(exclude=["tests"]),
+    python_requires=">=3.9",
+    install_requires=requirements,
+    # Optional speed-ups; the code falls back when they are not installed
+    extras_require={
+        "mypyc": ["mypy>=1.8.0"],
+        "onnx": ["onnxruntime>=1.16.0"],
+        "parquet": ["pyarrow>=14.0.0"],
+        "numba": ["numba>=0.58.0"],
+    },
+    ext_modules=ext_modules,
+    entry_points={
+        "console_scripts": [
+            "thinkr-chatbot=thinkr_chatbot.cli:main",
+        ],
+    },
+)
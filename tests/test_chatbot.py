@@ -4,14 +4,35 @@ Tests for the ThinkR chatbot.
 
 import pytest
 import os
+import asyncio
+import pickle
+import socket
+import threading
 import tempfile
-from unittest.mock import Mock, patch
+import numpy as np
+from unittest.mock import AsyncMock, Mock, patch
 from pathlib import Path
 
 from thinkr_chatbot.core.chatbot import ThinkRChatbot
+from thinkr_chatbot.core import vector_store as vector_store_module
 from thinkr_chatbot.core.vector_store import VectorStore
 from thinkr_chatbot.core.pdf_processor import PDFProcessor
 from thinkr_chatbot.core.prompt_manager import PromptManager
+from thinkr_chatbot.core.query_cache import QueryCache
+from thinkr_chatbot.core.proximity_cache import ProximityCache
+from thinkr_chatbot.core.response_cache import ResponseCache
+from thinkr_chatbot.core.embedding_cache import EmbeddingCache, content_hash
+from thinkr_chatbot.core import vector_store_kernels
+from thinkr_chatbot.core.vector_store_kernels import filter_topk
+from thinkr_chatbot.daemon import ChatbotDaemon, send_request
+
+
+@pytest.fixture(autouse=True)
+def clear_encoder_cache():
+    """Don't let an encoder (or mock) loaded by one test be reused by the next."""
+    vector_store_module._encoder_cache.clear()
+    yield
+    vector_store_module._encoder_cache.clear()
 
 
 class TestPromptManager:    
@@ -48,6 +69,15 @@ class TestPromptManager:
         pm.clear_history()
         
         assert len(pm.conversation_history) == 0
+    
+    def test_history_is_bounded(self):
+        """Test that only the most recent messages are kept."""
+        pm = PromptManager(max_history=4)
+        for i in range(6):
+            pm.add_to_history("user", f"message {i}")
+        
+        assert len(pm.conversation_history) == 4
+        assert [m["content"] for m in pm.get_recent_history(2)] == ["message 4", "message 5"]
 
 
 class TestPDFProcessor:
@@ -68,6 +98,97 @@ class TestPDFProcessor:
         assert len(sentences) == 2
         assert "```r\nx <- 1\n```" in sentences[0]
     
+    def test_manifest_skips_unchanged_files(self, tmp_path):
+        """Test that PDFs recorded in the manifest are skipped until they change."""
+        processor = PDFProcessor(max_workers=1)
+        (tmp_path / "a.pdf").write_bytes(b"a")
+        manifest = {}
+        
+        with patch.object(processor, 'process_pdf_file', return_value=[{'text': "a", 'metadata': {}}]) as process:
+            assert len(list(processor.iter_chunk_batches(str(tmp_path), manifest=manifest))) == 1
+            assert list(processor.iter_chunk_batches(str(tmp_path), manifest=manifest)) == []
+            assert process.call_count == 1
+        
+        assert processor.find_stale_files(manifest) == []
+        (tmp_path / "a.pdf").write_bytes(b"changed")
+        assert processor.find_stale_files(manifest) == [str((tmp_path / "a.pdf").resolve())]
+    
+    def test_manifest_with_symlinked_pdf(self, tmp_path):
+        """Test that a PDF reached through a symlink is checked once and other PDFs against their own entry."""
+        processor = PDFProcessor(max_workers=1)
+        (tmp_path / "a.pdf").write_bytes(b"a")
+        (tmp_path / "b.pdf").symlink_to(tmp_path / "a.pdf")
+        (tmp_path / "c.pdf").write_bytes(b"c")
+        manifest = {str((tmp_path / "a.pdf").resolve()): processor.file_signature(tmp_path / "a.pdf")}
+        
+        with patch.object(processor, 'process_pdf_file', return_value=[{'text': "c", 'metadata': {}}]) as process:
+            list(processor.iter_chunk_batches(str(tmp_path), manifest=manifest))
+        
+        assert [call.args[0].name for call in process.call_args_list] == ["c.pdf"]
+        assert str((tmp_path / "c.pdf").resolve()) in manifest
+    
+    def test_chunk_overlap_sentences(self):
+        """Test that consecutive chunks share the configured number of sentences."""
+        processor = PDFProcessor(chunk_size=40, chunk_overlap_sentences=1)
+        text = " ".join(f"Sentence number {i}." for i in range(6))
+        chunks = processor.chunk_text([{'text': text, 'page': 1}])
+        
+        assert len(chunks) > 1
+        for previous, current in zip(chunks, chunks[1:]):
+            assert current['start_sentence'] == previous['end_sentence']
+            assert current['text'].startswith(previous['text'].split(". ")[-1])
+    
+    def test_extracted_pages_hold_only_primitives(self, tmp_path):
+        """Test that extracted pages and chunks keep no live PDF objects (e.g. bbox)."""
+        fitz = pytest.importorskip("fitz")
+        pdf_path = tmp_path / "module.pdf"
+        doc = fitz.open()
+        doc.new_page().insert_text((72, 72), "Vectors are created with c(). See 1:23.")
+        doc.save(str(pdf_path))
+        doc.close()
+        
+        processor = PDFProcessor()
+        pages = processor.extract_text_from_pdf(str(pdf_path))['text_content']
+        chunks = processor.process_pdf_file(pdf_path)
+        
+        assert [set(page) for page in pages] == [{'page', 'text'}]
+        assert pickle.loads(pickle.dumps(chunks)) == chunks
+    
+    def test_skips_pages_without_text(self, tmp_path):
+        """Test that blank and figure-only pages (e.g. just a slide number) are not extracted."""
+        fitz = pytest.importorskip("fitz")
+        pdf_path = tmp_path / "slides.pdf"
+        doc = fitz.open()
+        doc.new_page()
+        doc.new_page().insert_text((72, 72), "12")
+        doc.new_page().insert_text((72, 72), "Data frames hold tabular data.")
+        doc.save(str(pdf_path))
+        doc.close()
+        
+        pages = PDFProcessor().extract_text_from_pdf(str(pdf_path))['text_content']
+        
+        assert [page['page'] for page in pages] == [3]
+    
+    def test_falls_back_when_pymupdf_fails_mid_file(self):
+        """Test that pages after a PyMuPDF extraction error are read with the next library."""
+        processor = PDFProcessor()
+        
+        def failing_pages(doc):
+            yield 1, "Vectors are created with c()."
+            raise RuntimeError("broken page")
+        
+        def plumber_pages():
+            yield 1, "Vectors are created with c()."
+            yield 2, "Data frames hold tabular data."
+        
+        with patch.object(processor, '_open_and_meta', return_value=(Mock(), {'title': "Basics"})), \
+                patch.object(processor, '_iter_pages', side_effect=failing_pages), \
+                patch.object(processor, '_open_with_pdfplumber', return_value=({}, plumber_pages())):
+            pages = processor.extract_text_from_pdf("module.pdf")
+        
+        assert [page['page'] for page in pages['text_content']] == [1, 2]
+        assert pages['metadata'] == {'title': "Basics"}
+    
     def test_extract_timestamps(self):
         """Test timestamp extraction."""
         processor = PDFProcessor()
@@ -76,6 +197,113 @@ class TestPDFProcessor:
         
         assert "12:34" in timestamps
         assert "1:23:45" in timestamps
+    
+    def test_extract_timestamps_longest_match(self):
+        """Test that each timestamp is reported once, in full and in text order."""
+        processor = PDFProcessor()
+        text = "Intro at 1:23:45, demo at 01:02:03.456 and recap at 12:34."
+        
+        assert processor.extract_timestamps(text) == ["1:23:45", "01:02:03.456", "12:34"]
+    
+    def test_iter_chunk_batches(self, tmp_path):
+        """Test that chunks are batched across files in order."""
+        processor = PDFProcessor(batch_size=3, max_workers=1)
+        for name in ["a.pdf", "b.pdf"]:
+            (tmp_path / name).touch()
+        
+        def fake_chunks(pdf_file):
+            return [{'text': f"{pdf_file.stem}{i}", 'metadata': {}} for i in range(2)]
+        
+        with patch.object(processor, 'process_pdf_file', side_effect=fake_chunks):
+            batches = list(processor.iter_chunk_batches(str(tmp_path)))
+        
+        assert [len(batch) for batch in batches] == [3, 1]
+        texts = [chunk['text'] for batch in batches for chunk in batch]
+        assert texts == ["a0", "a1", "b0", "b1"]
+
+
+class TestQueryCache:
+    """Test the query cache."""
+    
+    def test_get_and_set(self):
+        """Test cache hits and misses."""
+        cache = QueryCache()
+        key = QueryCache.make_key("chat", "test message", True, 5)
+        
+        assert cache.get(key) is None
+        cache.set(key, {"response": "test"})
+        assert cache.get(key) == {"response": "test"}
+        
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+    
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted."""
+        cache = QueryCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+    
+    def test_ttl_expiry(self):
+        """Test that expired entries are not returned."""
+        cache = QueryCache(ttl_seconds=0)
+        cache.set("a", 1)
+        
+        assert cache.get("a") is None
+
+
+class TestProximityCache:
+    """Test the semantic proximity cache."""
+    
+    def test_similar_queries_hit(self):
+        """Test that a near-identical embedding hits and a different one misses."""
+        cache = ProximityCache(threshold=0.95)
+        cache.set(np.array([1.0, 0.0, 0.0]), "vectors")
+        
+        assert cache.get(np.array([0.99, 0.05, 0.0])) == "vectors"
+        assert cache.get(np.array([0.0, 1.0, 0.0])) is None
+    
+    def test_lru_eviction(self):
+        """Test that the least recently used slot is replaced when full."""
+        cache = ProximityCache(capacity=2)
+        cache.set(np.array([1.0, 0.0]), "a")
+        cache.set(np.array([0.0, 1.0]), "b")
+        cache.get(np.array([1.0, 0.0]))
+        cache.set(np.array([1.0, 1.0]), "c")
+        
+        assert cache.get(np.array([1.0, 0.0])) == "a"
+        assert cache.get(np.array([0.0, 1.0])) is None
+        assert len(cache) == 2
+    
+    def test_response_cache_persists(self, tmp_path):
+        """Test that cached answers survive a restart and that clearing is persisted too."""
+        path = tmp_path / "resp_cache.sqlite"
+        cache = ResponseCache(path, threshold=0.87)
+        cache.set(np.array([1.0, 0.0]), {"response": "Use c()"})
+        
+        reloaded = ResponseCache(path, threshold=0.87)
+        assert reloaded.get(np.array([0.95, 0.1])) == {"response": "Use c()"}
+        
+        reloaded.clear()
+        assert len(ResponseCache(path)) == 0
+    
+    def test_response_cache_keeps_newest_answers(self, tmp_path):
+        """Test that the database is trimmed to the newest capacity answers."""
+        path = tmp_path / "resp_cache.sqlite"
+        cache = ResponseCache(path, capacity=2, threshold=0.99)
+        for i, vector in enumerate(np.eye(3)):
+            cache.set(vector, i)
+        
+        reloaded = ResponseCache(path, capacity=2, threshold=0.99)
+        assert len(reloaded) == 2
+        assert reloaded.get(np.array([1.0, 0.0, 0.0])) is None
+        assert reloaded.get(np.array([0.0, 0.0, 1.0])) == 2
 
 
 class TestVectorStore:
@@ -110,6 +338,475 @@ class TestVectorStore:
             vector_store.add_documents(documents)
             assert len(vector_store.metadata) == 2
 
+    
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_encoder_is_loaded_once_per_process(self, mock_transformer):
+        """Test that vector stores using the same model share one loaded encoder."""
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 2
+        
+        with tempfile.TemporaryDirectory() as first_dir, tempfile.TemporaryDirectory() as second_dir:
+            first = VectorStore(index_path=first_dir)
+            second = VectorStore(index_path=second_dir)
+            
+            assert first.encoder is second.encoder
+            mock_transformer.assert_called_once_with("all-MiniLM-L6-v2")
+    
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_progress_bar_only_when_indexing(self, mock_transformer):
+        """Test that only indexing asks the encoder for a progress bar, not query encoding."""
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 2
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: np.ones(
+            (len(texts), 2), dtype='float32'
+        )
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            vector_store = VectorStore(index_path=temp_dir, use_embedding_cache=False)
+            vector_store.add_documents([{"text": "doc", "metadata": {}}])
+            vector_store.similarity_search("query")
+            vector_store.search_many(["first", "second"])
+            
+            calls = mock_transformer.return_value.encode.call_args_list
+            assert [call.kwargs["show_progress_bar"] for call in calls] == [True, False, False]
+            assert all(call.kwargs["convert_to_numpy"] and call.kwargs["normalize_embeddings"] for call in calls)
+    
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_encode_sorted_preserves_order(self, mock_transformer):
+        """Test that length-sorted encoding returns embeddings in input order."""
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 2
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: np.array(
+            [[len(t), 1.0] for t in texts], dtype='float32'
+        )
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            vector_store = VectorStore(index_path=temp_dir)
+            embeddings = vector_store._encode_sorted(["ccc", "a", "bb"])
+            
+            assert embeddings[:, 0].tolist() == [3.0, 1.0, 2.0]
+
+    
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_embeddings_are_contiguous_float32(self, mock_transformer):
+        """Test that document and query embeddings reach FAISS as C-contiguous float32 in input order."""
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 2
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: np.array(
+            [[len(t), 1.0] for t in texts], dtype='float64'
+        )
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            vector_store = VectorStore(index_path=temp_dir, use_embedding_cache=False)
+            texts = ["ccc", "a", "bb"]
+            embeddings = vector_store._embed_documents(texts, [content_hash(t) for t in texts])
+            query_embedding = vector_store.embed_query("what is a vector")
+            
+            for array in (embeddings, query_embedding):
+                assert array.dtype == np.float32
+                assert array.flags['C_CONTIGUOUS']
+            assert np.argsort(embeddings[:, 1]).tolist() == [0, 2, 1]
+
+    
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_gpu_copy_tracks_added_documents(self, mock_transformer):
+        """Test that searches use the GPU copy of the index and that it sees later additions."""
+        import faiss
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 2
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: np.array(
+            [[1.0, 0.0] if "vector" in t else [0.0, 1.0] for t in texts], dtype='float32'
+        )
+        to_gpu = Mock(side_effect=lambda resources, device, index: faiss.clone_index(index))
+        
+        with patch.object(faiss, 'StandardGpuResources', Mock, create=True), \
+                patch.object(faiss, 'get_num_gpus', lambda: 1, create=True), \
+                patch.object(faiss, 'index_cpu_to_gpu', to_gpu, create=True), \
+                tempfile.TemporaryDirectory() as temp_dir:
+            vector_store = VectorStore(index_path=temp_dir, use_embedding_cache=False)
+            vector_store.add_documents([{"text": "vectors in R", "metadata": {"source": "a"}}])
+            assert vector_store.get_metadata(vector_store.similarity_search("a vector", k=1)[0]['index'])['source'] == "a"
+            
+            vector_store.add_documents([{"text": "data frames", "metadata": {"source": "b"}}])
+            assert vector_store.get_metadata(vector_store.similarity_search("data frame", k=1)[0]['index'])['source'] == "b"
+            assert to_gpu.call_count == 1
+
+    
+    @pytest.mark.parametrize("use_numba", [True, False])
+    def test_filter_topk(self, use_numba):
+        """Test that search hits are filtered by id and threshold, keeping search order per query."""
+        if use_numba and not vector_store_kernels.NUMBA_AVAILABLE:
+            pytest.skip("numba not installed")
+        
+        scores = np.array([[0.9, 0.6, 0.4], [0.8, 0.7, 0.1]], dtype='float32')
+        indices = np.array([[3, -1, 1], [0, 5, 2]], dtype='int64')
+        
+        with patch.object(vector_store_kernels, "NUMBA_AVAILABLE", use_numba):
+            rows, hit_scores, hit_ids = filter_topk(scores, indices, 0.5, 4)
+            assert rows.tolist() == [0, 1]
+            assert hit_ids.tolist() == [3, 0]
+            assert hit_scores.tolist() == pytest.approx([0.9, 0.8])
+            
+            rows, _, hit_ids = filter_topk(scores, indices, None, 4)
+            assert rows.tolist() == [0, 0, 1, 1]
+            assert hit_ids.tolist() == [3, 1, 0, 2]
+    
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_embed_query_is_cached(self, mock_transformer):
+        """Test that repeated queries are only encoded once."""
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 2
+        mock_transformer.return_value.encode.return_value = np.array([[0.6, 0.8]], dtype='float32')
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            vector_store = VectorStore(index_path=temp_dir)
+            first = vector_store.embed_query("what is a vector")
+            second = vector_store.embed_query("  what is  a vector ")
+            
+            assert mock_transformer.return_value.encode.call_count == 1
+            assert second is first
+            assert not first.flags.writeable
+
+    
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_scores_are_cosine_similarities(self, mock_transformer):
+        """Test that stored and query embeddings are unit-length, so scores are cosines."""
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 2
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: np.array(
+            [[3.0, 4.0] if "vector" in t else [4.0, -3.0] for t in texts], dtype='float32'
+        )
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            vector_store = VectorStore(index_path=temp_dir, use_embedding_cache=False)
+            vector_store.add_documents([
+                {"text": "vectors in R", "metadata": {"source": "a"}},
+                {"text": "data frames", "metadata": {"source": "b"}}
+            ])
+            results = vector_store.similarity_search("what is a vector", k=2, threshold=0.5)
+            
+            assert [vector_store.get_metadata(r['index'])['source'] for r in results] == ["a"]
+            assert results[0]['score'] == pytest.approx(1.0)
+
+    
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_results_are_ordered_by_score(self, mock_transformer):
+        """Test that hits come back best-first, as FAISS returns them, after threshold filtering."""
+        rng = np.random.default_rng(0)
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 8
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: rng.standard_normal(
+            (len(texts), 8)
+        ).astype('float32')
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            vector_store = VectorStore(index_path=temp_dir, use_embedding_cache=False)
+            vector_store.add_documents([{"text": f"doc {i}", "metadata": {}} for i in range(50)])
+            
+            for results in vector_store.search_many(["a", "b", "c"], k=10, threshold=0.1):
+                scores = [result['score'] for result in results]
+                assert scores == sorted(scores, reverse=True)
+                assert all(score >= 0.1 for score in scores)
+    
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_search_many_batches_queries(self, mock_transformer):
+        """Test that several queries are encoded in one call and repeats are searched once."""
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 2
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: np.array(
+            [[1.0, 0.0] if "vector" in t else [0.0, 1.0] for t in texts], dtype='float32'
+        )
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            vector_store = VectorStore(index_path=temp_dir, use_embedding_cache=False)
+            vector_store.add_documents([
+                {"text": "vectors in R", "metadata": {"source": "a"}},
+                {"text": "data frames", "metadata": {"source": "b"}}
+            ])
+            mock_transformer.return_value.encode.reset_mock()
+            
+            results = vector_store.search_many(["a vector", "data frame", "a  vector ", " "], k=1)
+            
+            assert [[vector_store.get_metadata(r['index'])['source'] for r in rs] for rs in results] == [["a"], ["b"], ["a"], []]
+            assert mock_transformer.return_value.encode.call_count == 1
+            assert mock_transformer.return_value.encode.call_args[0][0] == ["a vector", "data frame"]
+
+    
+    @patch('thinkr_chatbot.core.vector_store.HNSW_MIN_DOCUMENTS', 20)
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_switches_to_hnsw(self, mock_transformer):
+        """Test that a growing corpus is moved from the flat index to HNSW."""
+        rng = np.random.default_rng(0)
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 8
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: rng.random(
+            (len(texts), 8), dtype='float32'
+        )
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            vector_store = VectorStore(index_path=temp_dir)
+            vector_store.add_documents([{"text": f"doc {i}", "metadata": {}} for i in range(10)])
+            assert vector_store.get_index_stats()["index_type"] == "flat"
+            
+            vector_store.add_documents([{"text": f"doc {i}", "metadata": {}} for i in range(10, 30)])
+            stats = vector_store.get_index_stats()
+            assert stats["index_type"] == "hnsw"
+            assert stats["index_size"] == 30
+    
+    @patch('thinkr_chatbot.core.vector_store.IVF_MIN_DOCUMENTS', 200)
+    @patch('thinkr_chatbot.core.vector_store.HNSW_MIN_DOCUMENTS', 20)
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_switches_to_ivf(self, mock_transformer):
+        """Test that a large corpus is moved to a trained IVF index that still accepts documents after reload."""
+        rng = np.random.default_rng(0)
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 8
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: rng.random(
+            (len(texts), 8), dtype='float32'
+        )
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            vector_store = VectorStore(index_path=temp_dir, nprobe=4)
+            vector_store.add_documents([{"text": f"doc {i}", "metadata": {}} for i in range(30)])
+            vector_store.add_documents([{"text": f"doc {i}", "metadata": {}} for i in range(30, 400)])
+            assert vector_store.get_index_stats()["index_type"] == "ivf"
+            assert vector_store.index.nprobe == 4
+            
+            reloaded = VectorStore(index_path=temp_dir, nprobe=4)
+            reloaded.add_documents([{"text": f"doc {i}", "metadata": {}} for i in range(400, 410)])
+            stats = reloaded.get_index_stats()
+            assert stats["index_type"] == "ivf"
+            assert stats["index_size"] == 410
+    
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_duplicate_texts_are_encoded_once(self, mock_transformer):
+        """Test that repeated chunk texts are encoded once and still each get a vector."""
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 4
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: np.array(
+            [[len(text), 1, 0, 0] for text in texts], dtype='float32'
+        )
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            vector_store = VectorStore(index_path=temp_dir, use_embedding_cache=False)
+            texts = ["Welcome to the course", "vectors", "Welcome to the course", "data frames", "vectors"]
+            vector_store.add_documents([{"text": text, "metadata": {}} for text in texts])
+            
+            encoded = [text for call in mock_transformer.return_value.encode.call_args_list for text in call.args[0]]
+            assert sorted(encoded) == ["Welcome to the course", "data frames", "vectors"]
+            
+            vectors = vector_store.index.reconstruct_n(0, 5)
+            np.testing.assert_allclose(vectors[0], vectors[2])
+            np.testing.assert_allclose(vectors[1], vectors[4])
+            assert not np.allclose(vectors[0], vectors[1])
+    
+    @patch('thinkr_chatbot.core.vector_store.ENCODE_CHUNK_SIZE', 4)
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_documents_are_encoded_in_chunks(self, mock_transformer):
+        """Test that indexing encodes at most ENCODE_CHUNK_SIZE texts per call and keeps row order."""
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 2
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: np.array(
+            [[len(text), 1] for text in texts], dtype='float32'
+        )
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            vector_store = VectorStore(index_path=temp_dir, use_embedding_cache=False)
+            texts = ["x" * n for n in (5, 1, 9, 3, 7, 2, 8, 4, 6, 10)]
+            vector_store.add_documents([{"text": text, "metadata": {}} for text in texts])
+            
+            call_sizes = [len(call.args[0]) for call in mock_transformer.return_value.encode.call_args_list]
+            assert call_sizes == [4, 4, 2]
+            
+            expected = np.array([[len(text), 1] for text in texts], dtype='float32')
+            expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+            np.testing.assert_allclose(vector_store.index.reconstruct_n(0, len(texts)), expected, rtol=1e-6)
+    
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_reloaded_index_is_memory_mapped(self, mock_transformer):
+        """Test that a saved index is memory-mapped on load and can still be extended and saved."""
+        rng = np.random.default_rng(0)
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 8
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: rng.random(
+            (len(texts), 8), dtype='float32'
+        )
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            VectorStore(index_path=temp_dir).add_documents([{"text": f"doc {i}", "metadata": {}} for i in range(5)])
+            
+            reloaded = VectorStore(index_path=temp_dir)
+            assert reloaded._index_mmapped
+            reloaded.add_documents([{"text": f"doc {i}", "metadata": {}} for i in range(5, 8)])
+            
+            assert VectorStore(index_path=temp_dir).get_index_stats()["index_size"] == 8
+    
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_context_includes_chunk_text(self, mock_transformer):
+        """Test that chunk texts are stored on disk and put into the search context."""
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 2
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: np.array(
+            [[1, 0] if "vector" in text else [0, 1] for text in texts], dtype='float32'
+        )
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            vector_store = VectorStore(index_path=temp_dir)
+            vector_store.add_documents([
+                {"text": "Use c() to build a vector.", "metadata": {"title": "Vectors", "page": 3}},
+                {"text": "data.frame() builds a table.", "metadata": {"title": "Data frames", "page": 7}}
+            ])
+            
+            reloaded = VectorStore(index_path=temp_dir)
+            assert reloaded.get_document_text(1) == "data.frame() builds a table."
+            
+            context, references = reloaded.search_with_context("a vector", k=1)
+            assert "Vectors - Page 3" in context
+            assert "Use c() to build a vector." in context
+            assert "data.frame()" not in context
+            
+            reloaded.clear_index()
+            assert reloaded.get_document_text(0) is None
+    
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_rebuild_does_not_change_texts_under_readers(self, mock_transformer):
+        """Test that readers keep their loaded texts until reload, and an unsaved rebuild changes nothing on disk."""
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 2
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: np.ones(
+            (len(texts), 2), dtype='float32'
+        )
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            writer = VectorStore(index_path=temp_dir)
+            writer.add_documents([{"text": "old text", "metadata": {}}])
+            reader = VectorStore(index_path=temp_dir)
+            
+            # Rebuild that fails before saving
+            writer.clear_index(save=False)
+            writer.add_documents([{"text": "half-built", "metadata": {}}], save=False)
+            assert VectorStore(index_path=temp_dir).get_document_text(0) == "old text"
+            
+            writer.clear_index(save=False)
+            writer.add_documents([{"text": "new text", "metadata": {}}])
+            assert reader.get_document_text(0) == "old text"
+            
+            reader.reload_index()
+            assert reader.get_document_text(0) == "new text"
+    
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_detects_index_saved_by_another_process(self, mock_transformer):
+        """Test that a store notices when another process saves a new index, but not its own saves."""
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 2
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: np.ones(
+            (len(texts), 2), dtype='float32'
+        )
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            writer = VectorStore(index_path=temp_dir)
+            reader = VectorStore(index_path=temp_dir)
+            
+            writer.add_documents([{"text": "first", "metadata": {}}])
+            assert not writer.index_changed_on_disk()
+            assert reader.index_changed_on_disk()
+            
+            reader.reload_index()
+            assert not reader.index_changed_on_disk()
+            assert reader.get_index_stats()["total_documents"] == 1
+    
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_reload_waits_for_running_searches(self, mock_transformer):
+        """Test that a reload swaps in the new index, metadata and texts together, after searches finish."""
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 2
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: np.ones(
+            (len(texts), 2), dtype='float32'
+        )
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            writer = VectorStore(index_path=temp_dir)
+            writer.add_documents([{"text": "old text", "metadata": {"title": "Old"}}])
+            reader = VectorStore(index_path=temp_dir)
+            writer.clear_index(save=False)
+            writer.add_documents([{"text": "new text", "metadata": {"title": "New"}}])
+            
+            with reader.state_lock:
+                reload = threading.Thread(target=reader.reload_index)
+                reload.start()
+                reload.join(timeout=0.5)
+                # The search holding the lock still sees the old state, texts included
+                assert reload.is_alive()
+                assert reader.get_metadata(0)["title"] == "Old"
+                assert reader.get_document_text(0) == "old text"
+            reload.join()
+            
+            assert reader.get_metadata(0)["title"] == "New"
+            assert reader.get_document_text(0) == "new text"
+    
+    @patch('thinkr_chatbot.core.vector_store.PQ_MIN_DOCUMENTS', 300)
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_ivfpq_index(self, mock_transformer):
+        """Test that an "ivfpq" store stays exact while small, then trains product-quantized codes."""
+        rng = np.random.default_rng(0)
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 8
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: rng.random(
+            (len(texts), 8), dtype='float32'
+        )
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            vector_store = VectorStore(index_path=temp_dir, index_type="ivfpq", pq_m=3)
+            vector_store.add_documents([{"text": f"doc {i}", "metadata": {}} for i in range(30)])
+            assert vector_store.get_index_stats()["index_type"] == "flat"
+            
+            vector_store.add_documents([{"text": f"doc {i}", "metadata": {}} for i in range(30, 400)])
+            assert vector_store.get_index_stats()["index_type"] == "ivfpq"
+            # m=3 does not divide 8 dimensions, so the next smaller divisor is used
+            assert vector_store.index.pq.M == 2
+            
+            reloaded = VectorStore(index_path=temp_dir, index_type="ivfpq")
+            assert reloaded.get_index_stats()["index_type"] == "ivfpq"
+            assert reloaded.get_index_stats()["index_size"] == 400
+    
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_metadata_saved_as_parquet(self, mock_transformer):
+        """Test that metadata round-trips through parquet, including keys only some rows have."""
+        pytest.importorskip("pyarrow")
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 4
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: np.ones(
+            (len(texts), 4), dtype='float32'
+        )
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            vector_store = VectorStore(index_path=temp_dir)
+            vector_store.add_documents([
+                {"text": "vectors in R", "metadata": {"source": "a.pdf", "page": 1}},
+                {"text": "data frames", "metadata": {"source": "b.pdf", "page": 2, "title": "Data"}}
+            ])
+            
+            reloaded = VectorStore(index_path=temp_dir)
+            assert (Path(temp_dir) / "metadata.parquet").exists()
+            assert not (Path(temp_dir) / "metadata.pkl").exists()
+            assert reloaded.metadata == vector_store.metadata
+    
+    def test_embedding_cache_is_reset_for_other_encoder(self, tmp_path):
+        """Test that cached vectors are only reused by the encoder and hash scheme that stored them."""
+        db_path = tmp_path / "embedding_cache.sqlite"
+        key = content_hash("vectors in R")
+        cache = EmbeddingCache(db_path, "model-a")
+        cache.put_many([key], np.ones((1, 4), dtype='float32'))
+        cache.close()
+        
+        cache = EmbeddingCache(db_path, "model-a")
+        assert list(cache.get_many([key])) == [key]
+        cache.close()
+        
+        cache = EmbeddingCache(db_path, "model-b")
+        assert cache.get_many([key]) == {}
+        cache.close()
+    
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_embedding_cache_skips_known_texts(self, mock_transformer):
+        """Test that re-adding unchanged documents reuses cached embeddings."""
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 4
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: np.full(
+            (len(texts), 4), 0.5, dtype='float32'
+        )
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            documents = [{"text": f"doc {i}", "metadata": {}} for i in range(3)]
+            VectorStore(index_path=temp_dir).add_documents(documents)
+            
+            vector_store = VectorStore(index_path=temp_dir)
+            mock_transformer.return_value.encode.reset_mock()
+            vector_store.update_documents(documents + [{"text": "new doc", "metadata": {}}])
+            
+            encoded = mock_transformer.return_value.encode.call_args[0][0]
+            assert list(encoded) == ["new doc"]
+            assert vector_store.get_index_stats()["index_size"] == 4
+
 
 class TestThinkRChatbot:
     """Test the main chatbot."""
@@ -138,7 +835,7 @@ class TestThinkRChatbot:
     def test_chat_without_context(self, mock_faiss, mock_transformer, mock_openai):
         """Test chat without context."""
         mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 384
-        mock_openai.ChatCompletion.create.return_value.choices[0].message.content = "Test response"
+        mock_openai.OpenAI.return_value.chat.completions.create.return_value.choices[0].message.content = "Test response"
         
         with tempfile.TemporaryDirectory() as temp_dir:
             chatbot = ThinkRChatbot(
@@ -153,6 +850,75 @@ class TestThinkRChatbot:
             assert result["model"] == "gpt-4"
             assert not result["context_used"]
     
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "test_key"})
+    @patch('thinkr_chatbot.core.chatbot.openai')
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_sessions_share_index_but_not_history(self, mock_transformer, mock_openai):
+        """Test that a session chatbot reuses the index but keeps its own conversation."""
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 2
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            chatbot = ThinkRChatbot(vector_db_path=temp_dir, pdf_dir=temp_dir, use_response_cache=False)
+            session = chatbot.new_session()
+            session.prompt_manager.add_to_history("user", "How do I create a vector?")
+            
+            assert session.vector_store is chatbot.vector_store
+            assert session.retrieval_cache is chatbot.retrieval_cache
+            assert session.get_system_info()["conversation_history_length"] == 1
+            assert chatbot.get_system_info()["conversation_history_length"] == 0
+    
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "test_key"})
+    @patch('thinkr_chatbot.core.chatbot.openai')
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_chat_with_context(self, mock_transformer, mock_openai):
+        """Test that chat sends the retrieved course material to the LLM and encodes the question once."""
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 2
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: np.array(
+            [[1, 0] if "vector" in text else [0, 1] for text in texts], dtype='float32'
+        )
+        create = mock_openai.OpenAI.return_value.chat.completions.create
+        create.return_value.choices[0].message.content = "Use c()."
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            chatbot = ThinkRChatbot(vector_db_path=temp_dir, pdf_dir=temp_dir, use_response_cache=False)
+            chatbot.vector_store.add_documents([
+                {"text": "Use c() to build a vector.", "metadata": {"title": "Vectors", "page": 3}}
+            ])
+            mock_transformer.return_value.encode.reset_mock()
+            
+            result = chatbot.chat("How do I make a vector?")
+            
+            assert result["context_used"]
+            assert result["references"][0]["module"] == "Vectors"
+            assert "Use c() to build a vector." in create.call_args.kwargs["messages"][-1]["content"]
+            assert mock_transformer.return_value.encode.call_count == 1
+    
+    @patch.dict(os.environ, {"OPENAI_API_KEY": "test_key"})
+    @patch('thinkr_chatbot.core.chatbot.openai')
+    @patch('thinkr_chatbot.core.vector_store.SentenceTransformer')
+    def test_batch_chat_encodes_questions_once(self, mock_transformer, mock_openai):
+        """Test that batch_chat encodes all questions in one call for both the answer cache and the search."""
+        mock_transformer.return_value.get_sentence_embedding_dimension.return_value = 2
+        mock_transformer.return_value.encode.side_effect = lambda texts, **kwargs: np.array(
+            [[1, 0] if "vector" in text else [0, 1] for text in texts], dtype='float32'
+        )
+        async_client = Mock()
+        async_client.chat.completions.create = AsyncMock()
+        async_client.chat.completions.create.return_value.choices[0].message.content = "Use c()."
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            chatbot = ThinkRChatbot(vector_db_path=temp_dir, pdf_dir=temp_dir, async_client=async_client)
+            chatbot.vector_store.add_documents([
+                {"text": "Use c() to build a vector.", "metadata": {"title": "Vectors", "page": 3}}
+            ])
+            mock_transformer.return_value.encode.reset_mock()
+            
+            results = asyncio.run(chatbot.batch_chat(["A vector?", "Make a vector", "Plots?"]))
+            
+            assert [result["context_used"] for result in results] == [True, True, False]
+            assert mock_transformer.return_value.encode.call_count == 1
+            assert len(chatbot.response_cache) == 3
+    
     def test_get_system_info(self):
         """Test getting system information."""
         with tempfile.TemporaryDirectory() as temp_dir:
@@ -170,5 +936,71 @@ class TestThinkRChatbot:
             assert "vector_store_stats" in info
 
 
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="Unix sockets not available")
+class TestChatbotDaemon:
+    """Test cases for the CLI daemon."""
+    
+    def test_forwards_requests_to_shared_chatbot(self, tmp_path):
+        """Test that requests are answered by the daemon's chatbot instance."""
+        chatbot = Mock()
+        chatbot.get_recommendations.return_value = [{"module": "dplyr basics"}]
+        socket_path = str(tmp_path / "thinkr.sock")
+        
+        with ChatbotDaemon(socket_path, chatbot) as server:
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                result = send_request("recommend", ["dplyr", 2], socket_path=socket_path)
+                with pytest.raises(RuntimeError):
+                    send_request("unknown", [], socket_path=socket_path)
+            finally:
+                server.shutdown()
+        
+        assert result == [{"module": "dplyr basics"}]
+        chatbot.get_recommendations.assert_called_once_with("dplyr", 2)
+        assert not os.path.exists(socket_path)
+    
+    def test_refuses_to_replace_a_running_daemon(self, tmp_path):
+        """Test that a second daemon doesn't steal the socket of one that is still listening."""
+        socket_path = str(tmp_path / "thinkr.sock")
+        
+        with ChatbotDaemon(socket_path, Mock()):
+            with pytest.raises(RuntimeError):
+                ChatbotDaemon(socket_path, Mock())
+            assert os.path.exists(socket_path)
+        
+        # A plain file at the socket path is not ours to delete
+        Path(socket_path).write_text("not a socket")
+        with pytest.raises(RuntimeError):
+            ChatbotDaemon(socket_path, Mock())
+        assert Path(socket_path).read_text() == "not a socket"
+    
+    def test_client_rejects_socket_of_another_user(self, tmp_path):
+        """Test that clients don't talk to a socket they don't own."""
+        socket_path = str(tmp_path / "thinkr.sock")
+        
+        with ChatbotDaemon(socket_path, Mock()):
+            with patch("thinkr_chatbot.daemon.os.getuid", return_value=os.getuid() + 1):
+                with pytest.raises(RuntimeError):
+                    send_request("ask", ["hi"], socket_path=socket_path)
+    
+    def test_rejects_shared_socket_directory(self, tmp_path):
+        """Test that a world-writable socket directory is refused, even with the sticky bit."""
+        shared = tmp_path / "thinkr-shared"
+        shared.mkdir()
+        shared.chmod(0o1777)
+        socket_path = str(shared / "thinkr.sock")
+        
+        with pytest.raises(RuntimeError):
+            ChatbotDaemon(socket_path, Mock())
+        with pytest.raises(RuntimeError):
+            send_request("ask", ["hi"], socket_path=socket_path)
+        assert not os.path.exists(socket_path)
+    
+    def test_returns_none_without_daemon(self, tmp_path):
+        """Test that clients fall back when no daemon is listening."""
+        assert send_request("ask", ["hi"], socket_path=str(tmp_path / "missing.sock")) is None
+
+
 if __name__ == "__main__":
     pytest.main([__file__]) 
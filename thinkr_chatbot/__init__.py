@@ -2,12 +2,30 @@
 ThinkR Chatbot - A friendly R tutor for students learning R programming.
 """
 
+import importlib
+
 __version__ = "0.1.0"
 __author__ = "ThinkNeuro LLC"
 __email__ = "info@thinkneuro.com"
 
-from .core.chatbot import ThinkRChatbot
-from .core.vector_store import VectorStore
-from .core.pdf_processor import PDFProcessor
+# Imported on first access (PEP 562) so that touching the package does not
+# load openai, FAISS and torch
+_LAZY_IMPORTS = {
+    "ThinkRChatbot": ".core.chatbot",
+    "VectorStore": ".core.vector_store",
+    "PDFProcessor": ".core.pdf_processor",
+}
+
+__all__ = ["ThinkRChatbot", "VectorStore", "PDFProcessor"]
+
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
-__all__ = ["ThinkRChatbot", "VectorStore", "PDFProcessor"] 
\ No newline at end of file
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_IMPORTS))
@@ -4,52 +4,156 @@ FastAPI application for the ThinkR chatbot.
 
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+import os
+import asyncio
 import logging
-from typing import List
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
+
+import orjson
 
 from .models import (
     ChatRequest, ChatResponse, IndexResponse, SystemInfoResponse,
     RecommendationRequest, RecommendationResponse, ConversationExportResponse
 )
-from ..core.chatbot import ThinkRChatbot
+from ..core.chatbot import ThinkRChatbot, create_async_openai_client
+from ..core.query_cache import QueryCache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+class ORJSONResponse(JSONResponse):
+    """JSON response serialized with orjson instead of the stdlib json module."""
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+
+async def _create_chatbot(app: FastAPI) -> ThinkRChatbot:
+    """Create the shared chatbot once per worker and warm up its models."""
+    async with app.state.chatbot_lock:
+        if app.state.chatbot is None:
+            # One async OpenAI client (and connection pool) shared by all requests
+            if app.state.openai is None:
+                app.state.openai = create_async_openai_client()
+            bot = await asyncio.to_thread(ThinkRChatbot, async_client=app.state.openai)
+            # Run one search so the embedding model and FAISS index are loaded
+            # before the first real request arrives
+            await asyncio.to_thread(bot.vector_store.similarity_search, "R programming", 1)
+            app.state.chatbot = bot
+            logger.info("Chatbot initialized successfully")
+    return app.state.chatbot
+
+
+def _run_index(pdf_dir: str, vector_db_path: str, rebuild: bool = False) -> Dict[str, Any]:
+    """Index PDFs in a separate process so the API's event loop stays responsive."""
+    bot = ThinkRChatbot(pdf_dir=pdf_dir, vector_db_path=vector_db_path)
+    return bot.update_index() if rebuild else bot.index_pdfs()
+
+
+async def _index_in_background(bot: ThinkRChatbot, rebuild: bool = False):
+    """Run indexing in the worker process, then pick up the new index here."""
+    action = "index update" if rebuild else "indexing"
+    try:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            app.state.index_pool, _run_index, bot.pdf_dir, bot.vector_db_path, rebuild
+        )
+        # Other workers notice the saved index on their next request
+        async with app.state.reload_lock:
+            if await asyncio.to_thread(bot.reload_index_if_changed):
+                query_cache.clear()
+        logger.info(f"Background {action} completed: {result}")
+    except Exception as e:
+        logger.error(f"Background {action} failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load the chatbot at worker startup."""
+    # A single indexing process: the embedding model already uses every core,
+    # and it keeps two jobs from writing the index files at the same time.
+    # "spawn" avoids forking a process that has torch/OpenMP threads running.
+    app.state.index_pool = ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("spawn")
+    )
+    try:
+        await _create_chatbot(app)
+    except Exception as e:
+        # Keep serving; get_chatbot() retries and /health reports the failure
+        logger.error(f"Failed to initialize chatbot at startup: {e}")
+    yield
+    app.state.index_pool.shutdown(cancel_futures=True)
+    if app.state.openai is not None:
+        await app.state.openai.close()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="ThinkR Chatbot API",
     description="A friendly R tutor chatbot for students learning R programming",
     version="0.1.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
-# Add CORS middleware
+# One chatbot per worker, created at startup (or on first request if that failed)
+app.state.chatbot = None
+app.state.chatbot_lock = asyncio.Lock()
+app.state.reload_lock = asyncio.Lock()
+app.state.openai = None
+
+# Add CORS middleware (set CORS_ORIGINS to a comma-separated list in production)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Configure appropriately for production
+    allow_origins=os.getenv("CORS_ORIGINS", "*").split(","),
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    max_age=3600,
 )
 
-# Initialize chatbot (will be created on first request)
-chatbot: ThinkRChatbot = None
-
-
-def get_chatbot() -> ThinkRChatbot:
-    """Get or create the chatbot instance."""
-    global chatbot
-    if chatbot is None:
+# Compress larger JSON payloads (references, system info); SSE streams are left alone
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# Cache for repeated questions (skips embedding, search and LLM call)
+query_cache = QueryCache(max_size=2000, ttl_seconds=600)
+
+
+@app.middleware("http")
+async def reload_changed_index(request, call_next):
+    """Pick up an index saved by the indexing process or another worker before answering.
+    
+    Each uvicorn worker has its own chatbot and query cache, so every worker checks the
+    saved index (one stat call) instead of relying on the worker that started indexing.
+    """
+    bot = app.state.chatbot
+    if bot is not None and bot.vector_store.index_changed_on_disk():
+        async with app.state.reload_lock:
+            if await asyncio.to_thread(bot.reload_index_if_changed):
+                query_cache.clear()
+                logger.info("Reloaded index saved by another process")
+    return await call_next(request)
+
+
+async def get_chatbot() -> ThinkRChatbot:
+    """Get the chatbot instance stored on the app state."""
+    bot = app.state.chatbot
+    if bot is None:
         try:
-            chatbot = ThinkRChatbot()
-            logger.info("Chatbot initialized successfully")
+            bot = await _create_chatbot(app)
         except Exception as e:
             logger.error(f"Failed to initialize chatbot: {e}")
             raise HTTPException(status_code=500, detail="Failed to initialize chatbot")
-    return chatbot
+    return bot
 
 
 @app.get("/")
@@ -66,45 +170,86 @@ async def root():
 async def health_check():
     """Health check endpoint."""
     try:
-        bot = get_chatbot()
+        bot = await get_chatbot()
         return {"status": "healthy", "chatbot_initialized": True}
     except Exception as e:
         return {"status": "unhealthy", "error": str(e)}
 
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    """Chat endpoint for interacting with the R tutor."""
+async def _chat(message: str, use_context: bool, k_results: int) -> ChatResponse:
+    """Answer a chat message, serving repeated questions from the cache."""
     try:
-        bot = get_chatbot()
-        result = bot.chat(
-            message=request.message,
-            use_context=request.use_context,
-            k_results=request.k_results
-        )
+        key = QueryCache.make_key("chat", message, use_context, k_results)
+        result = query_cache.get(key)
+        
+        if result is None:
+            bot = await get_chatbot()
+            result = await bot.achat(
+                message=message,
+                use_context=use_context,
+                k_results=k_results
+            )
+            if "error" in result:
+                raise HTTPException(status_code=500, detail=result["error"])
+            query_cache.set(key, result)
         
-        return ChatResponse(**result)
+        # The result comes from our own code and FastAPI validates it against
+        # response_model anyway, so skip the extra validation pass here
+        return ChatResponse.model_construct(**result)
+        
+    except HTTPException:
+        raise
         
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest):
+    """Chat endpoint for interacting with the R tutor."""
+    return await _chat(request.message, request.use_context, request.k_results)
+
+
+@app.post("/chat/nocontext", response_model=ChatResponse)
+async def chat_without_context(request: ChatRequest):
+    """Chat without course material retrieval (no embedding or vector search)."""
+    return await _chat(request.message, False, request.k_results)
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Format a Server-Sent Events frame."""
+    return f"event: {event}\ndata: {orjson.dumps(data).decode()}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Stream the tutor's answer token by token as Server-Sent Events."""
+    bot = await get_chatbot()
+    
+    def events():
+        try:
+            for event in bot.chat_stream(
+                message=request.message,
+                use_context=request.use_context,
+                k_results=request.k_results
+            ):
+                yield _sse_event(event.pop("type"), event)
+        except Exception as e:
+            logger.error(f"Error in chat stream: {e}")
+            yield _sse_event("error", {"error": str(e)})
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
 @app.post("/index-pdfs", response_model=IndexResponse)
 async def index_pdfs(background_tasks: BackgroundTasks):
     """Index PDF documents in the background."""
     try:
-        bot = get_chatbot()
+        bot = await get_chatbot()
         
         # Run indexing in background
-        def index_task():
-            try:
-                result = bot.index_pdfs()
-                logger.info(f"Background indexing completed: {result}")
-            except Exception as e:
-                logger.error(f"Background indexing failed: {e}")
-        
-        background_tasks.add_task(index_task)
+        background_tasks.add_task(_index_in_background, bot, rebuild=False)
         
         return IndexResponse(
             status="started",
@@ -120,17 +265,10 @@ async def index_pdfs(background_tasks: BackgroundTasks):
 async def update_index(background_tasks: BackgroundTasks):
     """Update the vector index with new PDF documents."""
     try:
-        bot = get_chatbot()
+        bot = await get_chatbot()
         
         # Run update in background
-        def update_task():
-            try:
-                result = bot.update_index()
-                logger.info(f"Background index update completed: {result}")
-            except Exception as e:
-                logger.error(f"Background index update failed: {e}")
-        
-        background_tasks.add_task(update_task)
+        background_tasks.add_task(_index_in_background, bot, rebuild=True)
         
         return IndexResponse(
             status="started",
@@ -146,7 +284,7 @@ async def update_index(background_tasks: BackgroundTasks):
 async def get_system_info():
     """Get system information and statistics."""
     try:
-        bot = get_chatbot()
+        bot = await get_chatbot()
         info = bot.get_system_info()
         return SystemInfoResponse(**info)
         
@@ -159,11 +297,16 @@ async def get_system_info():
 async def get_recommendations(request: RecommendationRequest):
     """Get learning recommendations based on a topic."""
     try:
-        bot = get_chatbot()
-        recommendations = bot.get_recommendations(
-            topic=request.topic,
-            num_recommendations=request.num_recommendations
-        )
+        key = QueryCache.make_key("recommendations", request.topic, request.num_recommendations)
+        recommendations = query_cache.get(key)
+        
+        if recommendations is None:
+            bot = await get_chatbot()
+            recommendations = bot.get_recommendations(
+                topic=request.topic,
+                num_recommendations=request.num_recommendations
+            )
+            query_cache.set(key, recommendations)
         
         return RecommendationResponse(
             topic=request.topic,
@@ -176,11 +319,11 @@ async def get_recommendations(request: RecommendationRequest):
 
 
 @app.post("/chat/batch")
-async def batch_chat(messages: List[str]):
+async def batch_chat(messages: List[str], use_context: bool = True, k_results: int = 5):
     """Process multiple chat messages in batch."""
     try:
-        bot = get_chatbot()
-        results = bot.batch_chat(messages)
+        bot = await get_chatbot()
+        results = await bot.batch_chat(messages, use_context=use_context, k_results=k_results)
         return {"results": results}
         
     except Exception as e:
@@ -192,7 +335,7 @@ async def batch_chat(messages: List[str]):
 async def clear_conversation():
     """Clear the conversation history."""
     try:
-        bot = get_chatbot()
+        bot = await get_chatbot()
         bot.clear_conversation_history()
         return {"message": "Conversation history cleared"}
         
@@ -205,7 +348,7 @@ async def clear_conversation():
 async def export_conversation(format: str = "json"):
     """Export conversation history."""
     try:
-        bot = get_chatbot()
+        bot = await get_chatbot()
         export_data = bot.export_conversation(format=format)
         return ConversationExportResponse(**export_data)
         
@@ -218,8 +361,14 @@ async def export_conversation(format: str = "json"):
 async def search_documents(query: str, k: int = 5):
     """Search for similar documents."""
     try:
-        bot = get_chatbot()
-        results = bot.get_similar_documents(query, k=k)
+        key = QueryCache.make_key("search", query, k)
+        results = query_cache.get(key)
+        
+        if results is None:
+            bot = await get_chatbot()
+            results = bot.get_similar_documents(query, k=k)
+            query_cache.set(key, results)
+        
         return {"query": query, "results": results}
         
     except Exception as e:
@@ -227,6 +376,21 @@ async def search_documents(query: str, k: int = 5):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Get query cache statistics."""
+    stats = query_cache.stats()
+    if app.state.chatbot is not None:
+        stats["retrieval_cache"] = app.state.chatbot.retrieval_cache.stats()
+    return stats
+
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    # uvicorn picks uvloop and httptools automatically when installed (uvicorn[standard])
+    uvicorn.run(
+        "thinkr_chatbot.api.main:app",
+        host=os.getenv("API_HOST", "0.0.0.0"),
+        port=int(os.getenv("API_PORT", "8000")),
+        workers=int(os.getenv("API_WORKERS", "2"))
+    ) 
\ No newline at end of file
@@ -2,7 +2,7 @@
 Pydantic models for the ThinkR chatbot API.
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
@@ -16,6 +16,8 @@ class ChatRequest(BaseModel):
 
 class ChatResponse(BaseModel):
     """Response model for chat endpoint."""
+    model_config = ConfigDict(extra="ignore")
+    
     response: str = Field(..., description="The chatbot's response")
     raw_response: str = Field(..., description="Raw response without formatting")
     references: List[Dict[str, Any]] = Field(default_factory=list, description="Course material references")
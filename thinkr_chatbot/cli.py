@@ -6,22 +6,49 @@ import click
 import os
 import sys
 import json
+import time
+import asyncio
 from pathlib import Path
 from rich.console import Console
+from rich.live import Live
 from rich.panel import Panel
 from rich.markdown import Markdown
 from rich.table import Table
 from rich.progress import Progress, SpinnerColumn, TextColumn
 from dotenv import load_dotenv
 
-from .core.chatbot import ThinkRChatbot
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib json module
+    orjson = None
+
+# ThinkRChatbot is imported inside each command: it pulls in openai, FAISS and
+# torch, which `--help` and argument errors should not have to wait for
 
 # Load environment variables
 load_dotenv()
 
+# One console for the whole CLI; every screen update is rendered with a single print
 console = Console()
 
 
+def _key_value_table(title, key_header, rows):
+    """Build a two-column table from (label, value) rows."""
+    table = Table(title=title)
+    table.add_column(key_header, style="cyan")
+    table.add_column("Value", style="magenta")
+    for row in rows:
+        table.add_row(*row)
+    return table
+
+
+def _to_json(data):
+    """Serialize data as indented JSON, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(data, indent=2, ensure_ascii=False)
+
+
 @click.group()
 @click.version_option(version="0.1.0")
 def cli():
@@ -29,11 +56,56 @@ def cli():
     pass
 
 
+def _response_panel(text):
+    """Panel showing the tutor's (possibly partial) markdown response."""
+    return Panel(
+        Markdown(text),
+        title="[bold green]ThinkR Tutor[/bold green]",
+        border_style="green"
+    )
+
+
+async def _render_stream(chatbot, message):
+    """Stream a chat response into a live-updating panel and return the final event."""
+    parts = []
+    done = {}
+    last_render = 0.0
+    
+    with Live(_response_panel("*Thinking...*"), console=console, refresh_per_second=10,
+              vertical_overflow="visible") as live:
+        async for event in chatbot.achat_stream(message):
+            if event["type"] == "token":
+                parts.append(event["content"])
+                # Markdown is re-parsed on each update, so redraw a few times a second, not per token
+                now = time.monotonic()
+                if now - last_render >= 0.1:
+                    live.update(_response_panel("".join(parts)))
+                    last_render = now
+            else:
+                done = event
+        
+        live.update(_response_panel("".join(parts)))
+    
+    return done
+
+
+def _via_daemon(cmd, args):
+    """Forward a command to the 'serve' daemon, or return None to run it in this process."""
+    from .daemon import send_request
+    
+    result = send_request(cmd, args)
+    if result is None:
+        console.print("[dim]No ThinkR daemon running, loading the chatbot locally[/dim]")
+    return result
+
+
 @cli.command()
 @click.option("--pdf-dir", default="./data/pdfs", help="Directory containing PDF files")
 @click.option("--force", is_flag=True, help="Force re-indexing of all PDFs")
 def index_pdfs(pdf_dir, force):
     """Index PDF documents for retrieval."""
+    from .core.chatbot import ThinkRChatbot
+    
     try:
         console.print(f"[bold blue]Indexing PDFs from: {pdf_dir}[/bold blue]")
         
@@ -58,14 +130,12 @@ def index_pdfs(pdf_dir, force):
             console.print(f"[bold green]✓ {result['message']}[/bold green]")
             if "stats" in result:
                 stats = result["stats"]
-                table = Table(title="Indexing Statistics")
-                table.add_column("Metric", style="cyan")
-                table.add_column("Value", style="magenta")
-                table.add_row("Total Documents", str(stats["total_documents"]))
-                table.add_row("Index Size", str(stats["index_size"]))
-                table.add_row("Dimension", str(stats["dimension"]))
-                table.add_row("Model", stats["model_name"])
-                console.print(table)
+                console.print(_key_value_table("Indexing Statistics", "Metric", [
+                    ("Total Documents", str(stats["total_documents"])),
+                    ("Index Size", str(stats["index_size"])),
+                    ("Dimension", str(stats["dimension"])),
+                    ("Model", stats["model_name"]),
+                ]))
         else:
             console.print(f"[bold yellow]⚠ {result['message']}[/bold yellow]")
             
@@ -80,6 +150,8 @@ def index_pdfs(pdf_dir, force):
 @click.option("--max-tokens", default=1000, help="Maximum tokens for response")
 def chat(model, temperature, max_tokens):
     """Start an interactive chat session with the R tutor."""
+    from .core.chatbot import ThinkRChatbot
+    
     try:
         console.print(Panel.fit(
             "[bold blue]ThinkR Chatbot[/bold blue]\n"
@@ -102,6 +174,9 @@ def chat(model, temperature, max_tokens):
         if stats["vector_store_stats"]["total_documents"] == 0:
             console.print("[yellow]⚠ No course materials indexed. Run 'thinkr-chatbot index-pdfs' first.[/yellow]")
         
+        # One event loop for the whole session: the async client's connections are bound to it
+        loop = asyncio.new_event_loop()
+        
         while True:
             try:
                 # Get user input
@@ -130,56 +205,44 @@ def chat(model, temperature, max_tokens):
                 
                 if user_input.lower() == 'stats':
                     info = chatbot.get_system_info()
-                    table = Table(title="System Information")
-                    table.add_column("Property", style="cyan")
-                    table.add_column("Value", style="magenta")
-                    table.add_row("Model", info["model_name"])
-                    table.add_row("Temperature", str(info["temperature"]))
-                    table.add_row("Max Tokens", str(info["max_tokens"]))
-                    table.add_row("Indexed Documents", str(info["vector_store_stats"]["total_documents"]))
-                    table.add_row("Conversation History", str(info["conversation_history_length"]))
-                    console.print(table)
+                    console.print(_key_value_table("System Information", "Property", [
+                        ("Model", info["model_name"]),
+                        ("Temperature", str(info["temperature"])),
+                        ("Max Tokens", str(info["max_tokens"])),
+                        ("Indexed Documents", str(info["vector_store_stats"]["total_documents"])),
+                        ("Conversation History", str(info["conversation_history_length"])),
+                    ]))
                     continue
                 
                 if not user_input.strip():
                     continue
                 
-                # Get response
-                with console.status("[bold green]Thinking...[/bold green]"):
-                    result = chatbot.chat(user_input)
+                # Stream the response into a live panel as tokens arrive
+                done = loop.run_until_complete(_render_stream(chatbot, user_input))
                 
-                # Display response
-                if "error" in result:
-                    console.print(f"[bold red]Error: {result['error']}[/bold red]")
-                else:
-                    # Format and display the response
-                    response_md = Markdown(result["response"])
-                    console.print(Panel(
-                        response_md,
-                        title="[bold green]ThinkR Tutor[/bold green]",
-                        border_style="green"
-                    ))
+                # Show references if any
+                if done.get("references"):
+                    ref_table = Table(title="Course References")
+                    ref_table.add_column("Module", style="cyan")
+                    ref_table.add_column("Page", style="yellow")
+                    ref_table.add_column("Relevance", style="green")
                     
-                    # Show references if any
-                    if result["references"]:
-                        ref_table = Table(title="Course References")
-                        ref_table.add_column("Module", style="cyan")
-                        ref_table.add_column("Page", style="yellow")
-                        ref_table.add_column("Relevance", style="green")
-                        
-                        for ref in result["references"]:
-                            ref_table.add_row(
-                                ref.get("module", "Unknown"),
-                                ref.get("page", "N/A"),
-                                f"{ref.get('score', 0):.3f}"
-                            )
-                        console.print(ref_table)
+                    for ref in done["references"]:
+                        ref_table.add_row(
+                            ref.get("module", "Unknown"),
+                            ref.get("page", "N/A"),
+                            f"{ref.get('score', 0):.3f}"
+                        )
+                    console.print(ref_table)
                 
             except KeyboardInterrupt:
                 console.print("\n[bold blue]Goodbye! Happy learning![/bold blue]")
                 break
             except Exception as e:
                 console.print(f"[bold red]Error: {str(e)}[/bold red]")
+        
+        loop.run_until_complete(chatbot.aclose())
+        loop.close()
                 
     except Exception as e:
         console.print(f"[bold red]Failed to initialize chatbot: {str(e)}[/bold red]")
@@ -191,11 +254,15 @@ def chat(model, temperature, max_tokens):
 @click.argument("message")
 @click.option("--output", "-o", help="Output file for response")
 @click.option("--format", "output_format", default="text", type=click.Choice(["text", "json"]))
-def ask(message, output, output_format):
+@click.option("--via-daemon", is_flag=True, help="Use a running 'serve' daemon if there is one")
+def ask(message, output, output_format, via_daemon):
     """Ask a single question and get a response."""
     try:
-        chatbot = ThinkRChatbot()
-        result = chatbot.chat(message)
+        result = _via_daemon("ask", [message]) if via_daemon else None
+        if result is None:
+            from .core.chatbot import ThinkRChatbot
+            chatbot = ThinkRChatbot()
+            result = chatbot.chat(message)
         
         if output_format == "json":
             response_data = {
@@ -206,12 +273,12 @@ def ask(message, output, output_format):
                 "model": result["model"],
                 "timestamp": result["timestamp"]
             }
-            response_text = json.dumps(response_data, indent=2)
+            response_text = _to_json(response_data)
         else:
             response_text = result["response"]
         
         if output:
-            with open(output, 'w') as f:
+            with open(output, 'w', encoding='utf-8') as f:
                 f.write(response_text)
             console.print(f"[green]Response saved to {output}[/green]")
         else:
@@ -229,11 +296,15 @@ def ask(message, output, output_format):
 @cli.command()
 @click.argument("topic")
 @click.option("--count", "-c", default=3, help="Number of recommendations")
-def recommend(topic, count):
+@click.option("--via-daemon", is_flag=True, help="Use a running 'serve' daemon if there is one")
+def recommend(topic, count, via_daemon):
     """Get learning recommendations for a topic."""
     try:
-        chatbot = ThinkRChatbot()
-        recommendations = chatbot.get_recommendations(topic, count)
+        recommendations = _via_daemon("recommend", [topic, count]) if via_daemon else None
+        if recommendations is None:
+            from .core.chatbot import ThinkRChatbot
+            chatbot = ThinkRChatbot()
+            recommendations = chatbot.get_recommendations(topic, count)
         
         if not recommendations:
             console.print(f"[yellow]No recommendations found for '{topic}'[/yellow]")
@@ -263,26 +334,24 @@ def recommend(topic, count):
 @cli.command()
 def info():
     """Show system information and statistics."""
+    from .core.chatbot import ThinkRChatbot
+    
     try:
         chatbot = ThinkRChatbot()
         info = chatbot.get_system_info()
         
-        table = Table(title="ThinkR Chatbot System Information")
-        table.add_column("Property", style="cyan")
-        table.add_column("Value", style="magenta")
-        
-        table.add_row("Model", info["model_name"])
-        table.add_row("Temperature", str(info["temperature"]))
-        table.add_row("Max Tokens", str(info["max_tokens"]))
-        table.add_row("PDF Directory", info["pdf_directory"])
-        table.add_row("Vector DB Path", info["vector_db_path"])
-        table.add_row("Indexed Documents", str(info["vector_store_stats"]["total_documents"]))
-        table.add_row("Index Size", str(info["vector_store_stats"]["index_size"]))
-        table.add_row("Vector Dimension", str(info["vector_store_stats"]["dimension"]))
-        table.add_row("Embedding Model", info["vector_store_stats"]["model_name"])
-        table.add_row("Conversation History", str(info["conversation_history_length"]))
-        
-        console.print(table)
+        console.print(_key_value_table("ThinkR Chatbot System Information", "Property", [
+            ("Model", info["model_name"]),
+            ("Temperature", str(info["temperature"])),
+            ("Max Tokens", str(info["max_tokens"])),
+            ("PDF Directory", info["pdf_directory"]),
+            ("Vector DB Path", info["vector_db_path"]),
+            ("Indexed Documents", str(info["vector_store_stats"]["total_documents"])),
+            ("Index Size", str(info["vector_store_stats"]["index_size"])),
+            ("Vector Dimension", str(info["vector_store_stats"]["dimension"])),
+            ("Embedding Model", info["vector_store_stats"]["model_name"]),
+            ("Conversation History", str(info["conversation_history_length"])),
+        ]))
         
     except Exception as e:
         console.print(f"[bold red]Error: {str(e)}[/bold red]")
@@ -294,17 +363,19 @@ def info():
 @click.option("--output", "-o", help="Output file")
 def export(format, output):
     """Export conversation history."""
+    from .core.chatbot import ThinkRChatbot
+    
     try:
         chatbot = ThinkRChatbot()
         export_data = chatbot.export_conversation(format)
         
         if format == "json":
-            content = json.dumps(export_data, indent=2)
+            content = _to_json(export_data)
         else:
             content = export_data["conversation_text"]
         
         if output:
-            with open(output, 'w') as f:
+            with open(output, 'w', encoding='utf-8') as f:
                 f.write(content)
             console.print(f"[green]Conversation exported to {output}[/green]")
         else:
@@ -315,6 +386,27 @@ def export(format, output):
         sys.exit(1)
 
 
+@cli.command()
+@click.option("--socket", "socket_path", envvar="THINKR_SOCKET", default=None,
+              help="Unix socket to listen on (default: $THINKR_SOCKET, $XDG_RUNTIME_DIR/thinkr.sock or <tmp>/thinkr-<uid>/thinkr.sock)")
+def serve(socket_path):
+    """Keep the chatbot loaded and answer 'ask'/'recommend --via-daemon' requests."""
+    from .daemon import ChatbotDaemon, DEFAULT_SOCKET_PATH
+    from .core.chatbot import ThinkRChatbot
+    
+    socket_path = socket_path or DEFAULT_SOCKET_PATH
+    try:
+        chatbot = ThinkRChatbot()
+        with ChatbotDaemon(socket_path, chatbot) as server:
+            console.print(f"[bold green]ThinkR daemon listening on {socket_path}[/bold green] (Ctrl+C to stop)")
+            server.serve_forever()
+    except KeyboardInterrupt:
+        console.print("[yellow]ThinkR daemon stopped[/yellow]")
+    except Exception as e:
+        console.print(f"[bold red]Error: {str(e)}[/bold red]")
+        sys.exit(1)
+
+
 def main():
     """Main entry point."""
     cli()
@@ -2,9 +2,28 @@
 Core components for the ThinkR chatbot.
 """
 
-from .chatbot import ThinkRChatbot
-from .vector_store import VectorStore
-from .pdf_processor import PDFProcessor
-from .prompt_manager import PromptManager
+import importlib
 
-__all__ = ["ThinkRChatbot", "VectorStore", "PDFProcessor", "PromptManager"] 
\ No newline at end of file
+# Imported on first access (PEP 562) so that importing one lightweight module,
+# e.g. in a PDF extraction worker, does not load openai, FAISS and torch
+_LAZY_IMPORTS = {
+    "ThinkRChatbot": ".chatbot",
+    "VectorStore": ".vector_store",
+    "PDFProcessor": ".pdf_processor",
+    "PromptManager": ".prompt_manager",
+    "QueryCache": ".query_cache",
+}
+
+__all__ = ["ThinkRChatbot", "VectorStore", "PDFProcessor", "PromptManager", "QueryCache"]
+
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_IMPORTS))
\ No newline at end of file
@@ -3,21 +3,51 @@ Main chatbot class for ThinkR - A friendly R tutor for students.
 """
 
 import os
+import copy
+import time
+import asyncio
 import logging
-from typing import Dict, Any, List
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Iterator, AsyncIterator, Optional, Tuple
 from datetime import datetime
+import httpx
+import numpy as np
 import openai
 from dotenv import load_dotenv
 
 from .vector_store import VectorStore
 from .pdf_processor import PDFProcessor
 from .prompt_manager import PromptManager
+from .proximity_cache import ProximityCache
+from .response_cache import ResponseCache
 
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# How long get_system_info may reuse the vector store statistics
+STATS_TTL_SECONDS = 1.0
+
+# Cosine similarity above which an earlier answer is reused for a new question
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", 0.87))
+
+# HTTP/2 multiplexes concurrent requests over one connection (needs the h2 package)
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+OPENAI_CONNECTION_LIMITS = httpx.Limits(max_keepalive_connections=50, max_connections=100)
+
+# Runs course material searches alongside the rest of a chat request
+_RETRIEVAL_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="thinkr-retrieval")
+
+
+def create_async_openai_client(api_key: str = None) -> openai.AsyncOpenAI:
+    """Create an async OpenAI client with a keep-alive connection pool meant to be shared."""
+    return openai.AsyncOpenAI(
+        api_key=api_key or os.getenv("OPENAI_API_KEY"),
+        http_client=openai.DefaultAsyncHttpxClient(http2=HTTP2_AVAILABLE, limits=OPENAI_CONNECTION_LIMITS)
+    )
+
 
 class ThinkRChatbot:
     """Simple chatbot for ThinkR R tutoring."""
@@ -26,37 +56,119 @@ class ThinkRChatbot:
                  openai_api_key: str = None,
                  model_name: str = "gpt-4",
                  temperature: float = 0.7,
-                 max_tokens: int = 1000):
+                 max_tokens: int = 1000,
+                 pdf_dir: str = "./data/pdfs",
+                 vector_db_path: str = "./data/vector_db",
+                 async_client: openai.AsyncOpenAI = None,
+                 use_response_cache: bool = True):
         
         # Initialize OpenAI
         self.api_key = os.getenv("OPENAI_API_KEY")   #openai_api_key or 
         if not self.api_key:
             raise ValueError("OpenAI API key is required. Set OPENAI_API_KEY environment variable.")
         
-        openai.api_key = self.api_key
+        # Reuse one connection pool for every request instead of a new TLS handshake each time
+        self.client = openai.OpenAI(
+            api_key=self.api_key,
+            http_client=openai.DefaultHttpxClient(http2=HTTP2_AVAILABLE, limits=OPENAI_CONNECTION_LIMITS)
+        )
+        self._async_client = async_client
+        self._owns_async_client = False
         self.model_name = model_name
         self.temperature = temperature
         self.max_tokens = max_tokens
+        self.pdf_dir = pdf_dir
+        self.vector_db_path = vector_db_path
         
         # Initialize components
-        self.vector_store = VectorStore()
-        self.pdf_processor = PDFProcessor()
+        self.vector_store = VectorStore(index_path=vector_db_path)
+        self.pdf_processor = PDFProcessor(manifest_path=os.path.join(vector_db_path, "index_manifest.json"))
         self.prompt_manager = PromptManager()
         
+        # Students often re-ask the same question in other words; reuse its retrieval
+        self.retrieval_cache = ProximityCache(capacity=128, threshold=0.95)
+        
+        # Paraphrases of already answered questions skip retrieval and the LLM entirely
+        self.response_cache = None
+        if use_response_cache:
+            self.response_cache = ResponseCache(
+                os.path.join(vector_db_path, "resp_cache.sqlite"), threshold=RESPONSE_CACHE_THRESHOLD
+            )
+        
+        # (timestamp, stats) of the last vector store statistics read
+        self._stats_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+        
         logger.info(f"ThinkR Chatbot initialized with model: {model_name}")
     
-    def index_pdfs(self, pdf_dir: str = "./data/pdfs") -> Dict[str, Any]:
-        """Index PDF documents for retrieval."""
+    def index_pdfs(self, pdf_dir: str = None) -> Dict[str, Any]:
+        """Index new or changed PDF documents for retrieval."""
+        return self._index(pdf_dir, rebuild=False)
+    
+    def update_index(self, pdf_dir: str = None) -> Dict[str, Any]:
+        """Rebuild the index from scratch with the current PDF documents."""
+        return self._index(pdf_dir, rebuild=True)
+    
+    def reload_index(self):
+        """Reload the vector store from disk after another process rebuilt it."""
+        self.vector_store.reload_index()
+        self._invalidate_caches()
+    
+    def reload_index_if_changed(self) -> bool:
+        """Reload the vector store if another process saved a new index, returning whether it did."""
+        if not self.vector_store.index_changed_on_disk():
+            return False
+        self.reload_index()
+        return True
+    
+    def _invalidate_caches(self):
+        """Forget retrievals, answers and statistics that describe the previous index."""
+        self.retrieval_cache.clear()
+        if self.response_cache is not None:
+            self.response_cache.clear()
+        self._stats_cache = None
+    
+    def _index(self, pdf_dir: str = None, rebuild: bool = False) -> Dict[str, Any]:
+        """Process PDFs and add them to (or replace) the vector store contents."""
+        pdf_dir = pdf_dir or self.pdf_dir
         logger.info(f"Indexing PDFs from: {pdf_dir}")
         
-        # Process PDFs
-        chunks = self.pdf_processor.process_pdf_directory(pdf_dir)
+        # The manifest only describes the index if the index actually has documents
+        manifest = {}
+        if not rebuild and self.vector_store.get_index_stats()['total_documents'] > 0:
+            manifest = self.pdf_processor.load_manifest()
+        
+        # Vectors of an edited or deleted PDF can't be removed in place, so rebuild;
+        # the embedding cache keeps the unchanged chunks from being encoded again
+        stale = self.pdf_processor.find_stale_files(manifest)
+        if stale:
+            logger.info(f"{len(stale)} indexed PDFs changed or were removed, rebuilding the index")
+            rebuild = True
+            manifest = {}
+        up_to_date = bool(manifest)
+        
+        # Encode and add chunks batch by batch as the PDFs are processed
+        num_chunks = 0
+        for batch in self.pdf_processor.iter_chunk_batches(pdf_dir, manifest=manifest):
+            # Only drop the old index once there is something to replace it with; the
+            # saved one stays in place until the rebuilt index is saved below
+            if rebuild and not num_chunks:
+                self.vector_store.clear_index(save=False)
+                self._stats_cache = None
+            self.vector_store.add_documents(batch, save=False)
+            num_chunks += len(batch)
         
-        if not chunks:
+        if not num_chunks:
+            if up_to_date:
+                return {
+                    "status": "success",
+                    "message": "Index is up to date, no new or changed PDFs",
+                    "stats": self.vector_store.get_index_stats()
+                }
             return {"status": "warning", "message": "No PDF chunks found to index"}
         
-        # Add to vector store
-        self.vector_store.add_documents(chunks)
+        self.vector_store.save_index()
+        self.pdf_processor.save_manifest(manifest)
+        self._invalidate_caches()
         
         stats = self.vector_store.get_index_stats()
         logger.info(f"Indexed {stats['total_documents']} documents")
@@ -67,67 +179,307 @@ class ThinkRChatbot:
             "stats": stats
         }
     
-    def chat(self, message: str, use_context: bool = True) -> Dict[str, Any]:
+    def chat(self, message: str, use_context: bool = True, k_results: int = 5) -> Dict[str, Any]:
         """Process a chat message and return a response."""
         try:
+            # Embed the question up front so the search and the answer cache don't
+            # both encode it; embed_query keeps the vector for the second caller
+            if use_context and message.strip():
+                self.vector_store.embed_query(message)
+            
+            # Search the course material while the answer cache is checked; the
+            # search result is simply unused when a cached answer is found
+            retrieval = _RETRIEVAL_EXECUTOR.submit(self._retrieve, message, k_results) if use_context else None
+            
+            cached = self._cached_response(message, use_context, k_results)
+            if cached is not None:
+                return cached
+            
             # Get relevant context from vector store
             context = ""
             references = []
             
-            if use_context:
-                context, references = self.vector_store.search_with_context(message, k=5)
-            
-            # Format messages for OpenAI
-            messages = self.prompt_manager.get_messages_with_context(message, context)
-            
-            # Call OpenAI API
-            response = openai.ChatCompletion.create(
-                model=self.model_name,
-                messages=messages,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens
-            )
+            if retrieval is not None:
+                context, references = retrieval.result()
             
-            # Extract response
-            assistant_message = response.choices[0].message.content
+            result = self._respond(message, context, references)
+            self._cache_response(message, use_context, k_results, result)
+            return result
             
-            # Format response with references
-            formatted_response = self.prompt_manager.format_response_with_references(
-                assistant_message, references
-            )
+        except Exception as e:
+            return self._error_result(e)
+    
+    async def achat(self, message: str, use_context: bool = True, k_results: int = 5) -> Dict[str, Any]:
+        """Async version of chat that awaits the LLM call on the shared async client."""
+        try:
+            cached = await asyncio.to_thread(self._cached_response, message, use_context, k_results)
+            if cached is not None:
+                return cached
             
-            # Add to conversation history
-            self.prompt_manager.add_to_history("user", message)
-            self.prompt_manager.add_to_history("assistant", assistant_message)
+            context = ""
+            references = []
             
-            # Prepare response
-            result = {
-                "response": formatted_response,
-                "raw_response": assistant_message,
-                "references": references,
-                "context_used": bool(context),
-                "model": self.model_name,
-                "timestamp": datetime.now().isoformat()
-            }
+            if use_context:
+                context, references = await asyncio.to_thread(self._retrieve, message, k_results)
             
-            logger.info(f"Generated response with {len(references)} references")
+            result = await self._respond_async(message, context, references)
+            await asyncio.to_thread(self._cache_response, message, use_context, k_results, result)
             return result
             
         except Exception as e:
-            logger.error(f"Error in chat: {e}")
-            return {
-                "response": "I apologize, but I encountered an error while processing your request. Please try again.",
-                "error": str(e),
-                "timestamp": datetime.now().isoformat()
-            }
+            return self._error_result(e)
+    
+    async def batch_chat(self, messages: List[str], use_context: bool = True, k_results: int = 5) -> List[Dict[str, Any]]:
+        """Process several chat messages, retrieving context for all of them in one search."""
+        if not messages:
+            return []
+        
+        try:
+            results, pending, contexts, embeddings = await asyncio.to_thread(
+                self._cached_or_retrieve_many, messages, use_context, k_results
+            )
+        except Exception as e:
+            return [self._error_result(e) for _ in messages]
+        
+        async def respond(i, context, references):
+            try:
+                result = await self._respond_async(messages[i], context, references)
+            except Exception as e:
+                return self._error_result(e)
+            embedding = embeddings[i] if embeddings is not None else None
+            await asyncio.to_thread(self._cache_response, messages[i], use_context, k_results, result, embedding)
+            return result
+        
+        # LLM calls are independent network round-trips, so overlap them on the shared client
+        answers = await asyncio.gather(*(
+            respond(i, context, references)
+            for i, (context, references) in zip(pending, contexts)
+        ))
+        for i, answer in zip(pending, answers):
+            results[i] = answer
+        
+        return results
+    
+    def chat_stream(self, message: str, use_context: bool = True, k_results: int = 5) -> Iterator[Dict[str, Any]]:
+        """Stream a chat response as it is generated.
+        
+        Yields ``{"type": "token", "content": ...}`` events while the model
+        generates, then a final ``{"type": "done", ...}`` event with the references.
+        """
+        context = ""
+        references = []
+        
+        if use_context:
+            context, references = self._retrieve(message, k_results)
+        
+        messages = self.prompt_manager.get_messages_with_context(message, context)
+        
+        stream = self.client.chat.completions.create(**self._completion_args(messages), stream=True)
+        
+        parts = []
+        for chunk in stream:
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            if content:
+                parts.append(content)
+                yield {"type": "token", "content": content}
+        
+        yield self._finish_stream(message, "".join(parts), context, references)
+    
+    async def achat_stream(self, message: str, use_context: bool = True, k_results: int = 5) -> AsyncIterator[Dict[str, Any]]:
+        """Async version of chat_stream using the shared async client."""
+        context = ""
+        references = []
+        
+        if use_context:
+            context, references = await asyncio.to_thread(self._retrieve, message, k_results)
+        
+        messages = self.prompt_manager.get_messages_with_context(message, context)
+        
+        stream = await self.async_client.chat.completions.create(**self._completion_args(messages), stream=True)
+        
+        parts = []
+        async for chunk in stream:
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            if content:
+                parts.append(content)
+                yield {"type": "token", "content": content}
+        
+        yield self._finish_stream(message, "".join(parts), context, references)
+    
+    def _finish_stream(self, message: str, assistant_message: str, context: str,
+                       references: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Record a streamed exchange in the history and build the final event."""
+        self.prompt_manager.add_to_history("user", message)
+        self.prompt_manager.add_to_history("assistant", assistant_message)
+        
+        return {
+            "type": "done",
+            "references": references,
+            "context_used": bool(context),
+            "model": self.model_name,
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    def _retrieve(self, message: str, k_results: int) -> Tuple[str, List[Dict[str, Any]]]:
+        """Get context for a message, reusing the results of a near-identical recent question."""
+        if not message.strip():
+            return "", []
+        
+        # Embed once: the same vector serves the cache lookup and, on a miss, the index search
+        query_embedding = self.vector_store.embed_query(message)
+        
+        cached = self.retrieval_cache.get(query_embedding)
+        if cached is not None and cached[0] == k_results:
+            return cached[1]
+        
+        result = self.vector_store.search_with_context(message, k=k_results, query_embedding=query_embedding)
+        self.retrieval_cache.set(query_embedding, (k_results, result))
+        return result
+    
+    def _cached_response(self, message: str, use_context: bool, k_results: int,
+                         query_embedding: Optional[np.ndarray] = None) -> Optional[Dict[str, Any]]:
+        """Return the stored answer to a near-identical earlier question, if there is one."""
+        # Without context no query embedding is needed, so don't compute one just for the cache
+        if self.response_cache is None or not use_context or not message.strip():
+            return None
+        
+        if query_embedding is None:
+            query_embedding = self.vector_store.embed_query(message)
+        cached = self.response_cache.get(query_embedding)
+        if cached is None or cached[0] != (self.model_name, k_results):
+            return None
+        
+        result = dict(cached[1])
+        result["timestamp"] = datetime.now().isoformat()
+        self.prompt_manager.add_to_history("user", message)
+        self.prompt_manager.add_to_history("assistant", result["raw_response"])
+        
+        logger.info("Answered from the response cache")
+        return result
+    
+    def _cache_response(self, message: str, use_context: bool, k_results: int, result: Dict[str, Any],
+                        query_embedding: Optional[np.ndarray] = None):
+        """Remember an answer so paraphrases of the question can reuse it."""
+        if self.response_cache is None or not use_context or not message.strip():
+            return
+        
+        if query_embedding is None:
+            query_embedding = self.vector_store.embed_query(message)
+        self.response_cache.set(query_embedding, ((self.model_name, k_results), result))
+    
+    def _cached_or_retrieve_many(self, messages: List[str], use_context: bool, k_results: int
+                                 ) -> Tuple[List[Optional[Dict[str, Any]]], List[int],
+                                            List[Tuple[str, List[Dict[str, Any]]]], Optional[np.ndarray]]:
+        """Look up cached answers, then retrieve context for the messages that have none.
+        
+        Returns the answers (None where not cached), the positions still to be answered,
+        their (context, references) and the message embeddings (None without context).
+        """
+        if not use_context:
+            return [None] * len(messages), list(range(len(messages))), [("", [])] * len(messages), None
+        
+        # One encoder call serves both the answer cache and the search
+        embeddings = self.vector_store.embed_queries(messages)
+        results = [
+            self._cached_response(message, use_context, k_results, query_embedding=embedding)
+            for message, embedding in zip(messages, embeddings)
+        ]
+        pending = [i for i, result in enumerate(results) if result is None]
+        contexts = self.vector_store.batch_search_with_context(
+            [messages[i] for i in pending], k=k_results, query_embeddings=embeddings[pending]
+        )
+        return results, pending, contexts, embeddings
+    
+    @property
+    def async_client(self) -> openai.AsyncOpenAI:
+        """The async OpenAI client, created on first use unless one was injected."""
+        if self._async_client is None:
+            self._async_client = create_async_openai_client(self.api_key)
+            self._owns_async_client = True
+        return self._async_client
+    
+    async def aclose(self):
+        """Close the async client if this chatbot created it (injected clients belong to the caller)."""
+        if self._owns_async_client:
+            await self._async_client.close()
+            self._async_client = None
+            self._owns_async_client = False
+    
+    def _completion_args(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Arguments shared by every chat completion request."""
+        return {
+            "model": self.model_name,
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens
+        }
+    
+    def _respond(self, message: str, context: str, references: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Generate a response for a message given its retrieved context."""
+        # Format messages for OpenAI
+        messages = self.prompt_manager.get_messages_with_context(message, context)
+        
+        # Call OpenAI API
+        response = self.client.chat.completions.create(**self._completion_args(messages))
+        
+        return self._build_result(message, response.choices[0].message.content, context, references)
+    
+    async def _respond_async(self, message: str, context: str, references: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Async version of _respond using the shared async client."""
+        messages = self.prompt_manager.get_messages_with_context(message, context)
+        
+        response = await self.async_client.chat.completions.create(**self._completion_args(messages))
+        
+        return self._build_result(message, response.choices[0].message.content, context, references)
+    
+    def _build_result(self, message: str, assistant_message: str, context: str,
+                      references: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Record the exchange in the history and build the chat result."""
+        # Format response with references
+        formatted_response = self.prompt_manager.format_response_with_references(
+            assistant_message, references
+        )
+        
+        # Add to conversation history
+        self.prompt_manager.add_to_history("user", message)
+        self.prompt_manager.add_to_history("assistant", assistant_message)
+        
+        # Prepare response
+        result = {
+            "response": formatted_response,
+            "raw_response": assistant_message,
+            "references": references,
+            "context_used": bool(context),
+            "model": self.model_name,
+            "timestamp": datetime.now().isoformat()
+        }
+        
+        logger.info(f"Generated response with {len(references)} references")
+        return result
+    
+    def _error_result(self, error: Exception) -> Dict[str, Any]:
+        """Build the response returned when a chat request fails."""
+        logger.error(f"Error in chat: {error}")
+        return {
+            "response": "I apologize, but I encountered an error while processing your request. Please try again.",
+            "error": str(error),
+            "timestamp": datetime.now().isoformat()
+        }
     
     def get_recommendations(self, topic: str, num_recommendations: int = 3) -> List[Dict[str, Any]]:
         """Get learning recommendations based on a topic."""
-        similar_docs = self.vector_store.similarity_search(topic, k=num_recommendations)
+        if not topic.strip():
+            return []
+        query_embedding = self.vector_store.embed_query(topic)
+        
+        # Look up metadata from the same index the search used, even if it is reloaded meanwhile
+        with self.vector_store.state_lock:
+            similar_docs = self.vector_store.similarity_search(topic, k=num_recommendations,
+                                                               query_embedding=query_embedding)
+            doc_metadata = [self.vector_store.get_metadata(doc['index']) for doc in similar_docs]
         
         recommendations = []
-        for doc in similar_docs:
-            metadata = doc['metadata']
+        for doc, metadata in zip(similar_docs, doc_metadata):
             recommendation = {
                 'topic': topic,
                 'module': metadata.get('title', 'Unknown Module'),
@@ -140,19 +492,67 @@ class ThinkRChatbot:
         
         return recommendations
     
+    def get_similar_documents(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+        """Get the course material chunks most similar to a query."""
+        if not query.strip():
+            return []
+        query_embedding = self.vector_store.embed_query(query)
+        
+        with self.vector_store.state_lock:
+            results = self.vector_store.similarity_search(query, k=k, query_embedding=query_embedding)
+            # Callers get their own copy of the metadata, not the store's
+            return [
+                {**result, 'metadata': self.vector_store.get_metadata(result['index']).copy()}
+                for result in results
+            ]
+    
+    def new_session(self) -> "ThinkRChatbot":
+        """A chatbot with its own conversation history that shares this one's index, caches and clients."""
+        session = copy.copy(self)
+        session.prompt_manager = PromptManager()
+        session._stats_cache = None
+        # Only the original closes a client it created
+        session._owns_async_client = False
+        return session
+    
     def clear_conversation_history(self):
         """Clear the conversation history."""
         self.prompt_manager.clear_history()
         logger.info("Conversation history cleared")
     
+    def export_conversation(self, format: str = "json") -> Dict[str, Any]:
+        """Export the conversation history as a list of messages or as plain text."""
+        history = list(self.prompt_manager.conversation_history)
+        export_data = {
+            "export_timestamp": datetime.now().isoformat(),
+            "total_messages": len(history)
+        }
+        
+        if format == "text":
+            export_data["conversation_text"] = "\n\n".join(
+                f"{msg.role.capitalize()}: {msg.content}" for msg in history
+            )
+        else:
+            export_data["conversation"] = [
+                {"role": msg.role, "content": msg.content, "timestamp": msg.timestamp}
+                for msg in history
+            ]
+        
+        return export_data
+    
     def get_system_info(self) -> Dict[str, Any]:
         """Get system information and statistics."""
-        vector_stats = self.vector_store.get_index_stats()
+        now = time.monotonic()
+        if self._stats_cache is None or now - self._stats_cache[0] >= STATS_TTL_SECONDS:
+            self._stats_cache = (now, self.vector_store.get_index_stats())
+        vector_stats = dict(self._stats_cache[1])
         
         return {
             "model_name": self.model_name,
             "temperature": self.temperature,
             "max_tokens": self.max_tokens,
             "vector_store_stats": vector_stats,
-            "conversation_history_length": len(self.prompt_manager.conversation_history)
+            "conversation_history_length": len(self.prompt_manager.conversation_history),
+            "pdf_directory": self.pdf_dir,
+            "vector_db_path": self.vector_db_path
         } 
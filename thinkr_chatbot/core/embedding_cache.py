@@ -0,0 +1,106 @@
+"""
+Persistent SQLite cache of chunk embeddings, keyed by the chunk's content hash.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+_MAX_PARAMS = 500
+
+# Stored with the cache so entries keyed by another hash function are dropped
+HASH_SCHEME = "blake2b-128"
+
+
+def content_hash(text: str) -> str:
+    """Hash chunk text so unchanged chunks can be recognised across re-indexing."""
+    # blake2b is faster than sha256 on 64-bit CPUs; 128 bits is plenty to tell chunks apart
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk map from content hash to embedding for a single embedding model."""
+    
+    def __init__(self, db_path: str, model_name: str):
+        self.db_path = Path(db_path)
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS embeddings (
+                hash TEXT PRIMARY KEY,
+                dtype TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL
+            );
+        """)
+        self._check_model()
+    
+    def _check_model(self):
+        """Drop cached vectors that were produced by a different embedding model or hash function."""
+        with self._lock, self._conn:
+            meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+            if meta.get('model_name') == self.model_name and meta.get('hash_scheme') == HASH_SCHEME:
+                return
+            
+            if 'model_name' in meta:
+                logger.info(f"Embedding cache was built for {meta['model_name']} "
+                            f"({meta.get('hash_scheme', 'sha256')}), clearing it")
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [('model_name', self.model_name), ('hash_scheme', HASH_SCHEME)]
+            )
+    
+    def get_many(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Look up embeddings for the given hashes, returning only the ones that are cached."""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        
+        with self._lock:
+            for start in range(0, len(unique), _MAX_PARAMS):
+                batch = unique[start:start + _MAX_PARAMS]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT hash, dtype, dim, vector FROM embeddings WHERE hash IN ({placeholders})", batch
+                )
+                for hash_, dtype, dim, vector in rows:
+                    found[hash_] = np.frombuffer(vector, dtype=dtype).reshape(dim)
+        
+        return found
+    
+    def put_many(self, hashes: List[str], embeddings: np.ndarray):
+        """Store embeddings (one row per hash) in a single transaction."""
+        rows = [
+            (hash_, str(vector.dtype), vector.shape[0], vector.tobytes())
+            for hash_, vector in zip(hashes, embeddings)
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (hash, dtype, dim, vector) VALUES (?, ?, ?, ?)", rows
+            )
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    
+    def clear(self):
+        """Remove all cached embeddings."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM embeddings")
+    
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
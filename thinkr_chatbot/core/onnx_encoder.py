@@ -0,0 +1,138 @@
+"""
+ONNX Runtime sentence encoder with int8-quantized weights for fast CPU embedding.
+"""
+
+import os
+import json
+import logging
+from pathlib import Path
+from typing import List, Union
+
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError as e:
+    logging.warning(f"ONNX Runtime not available: {e}")
+    ort = None
+
+logger = logging.getLogger(__name__)
+
+ONNX_MODEL_FILE = "model-int8.onnx"
+ENCODER_CONFIG_FILE = "encoder_config.json"
+
+
+def export_quantized_encoder(model_name: str, output_dir: str) -> Path:
+    """Export a SentenceTransformer model to ONNX and quantize its weights to int8."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    
+    class TransformerBody(torch.nn.Module):
+        """Expose the transformer with a fixed (input_ids, attention_mask) signature."""
+        
+        def __init__(self, transformer):
+            super().__init__()
+            self.transformer = transformer
+        
+        def forward(self, input_ids, attention_mask):
+            return self.transformer(input_ids=input_ids, attention_mask=attention_mask)[0]
+    
+    model = SentenceTransformer(model_name, device="cpu")
+    tokenizer = model.tokenizer
+    tokenizer.save_pretrained(str(output_dir))
+    
+    # Export the transformer body; mean pooling is done in NumPy at encode time
+    dummy = tokenizer(["How do I create a vector in R?"], return_tensors="pt")
+    fp32_path = output_dir / "model.onnx"
+    torch.onnx.export(
+        TransformerBody(model[0].auto_model).eval(),
+        (dummy["input_ids"], dummy["attention_mask"]),
+        str(fp32_path),
+        input_names=["input_ids", "attention_mask"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "last_hidden_state": {0: "batch", 1: "sequence"},
+        },
+        opset_version=14,
+        dynamo=False
+    )
+    
+    int8_path = output_dir / ONNX_MODEL_FILE
+    quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+    
+    # Keep the pipeline settings the quantized model has to reproduce
+    normalize = any(type(module).__name__ == "Normalize" for module in model)
+    with open(output_dir / ENCODER_CONFIG_FILE, "w") as f:
+        json.dump({"max_seq_length": model.max_seq_length, "normalize": normalize}, f)
+    
+    logger.info(f"Exported int8 ONNX encoder for {model_name} to {int8_path}")
+    return int8_path
+
+
+class ORTSentenceEncoder:
+    """Drop-in replacement for the parts of SentenceTransformer the vector store uses."""
+    
+    def __init__(self, model_dir: str, num_threads: int = None):
+        if ort is None:
+            raise ImportError("onnxruntime is required for the ONNX encoder")
+        
+        from transformers import AutoTokenizer
+        
+        self.model_dir = Path(model_dir)
+        
+        config_file = self.model_dir / ENCODER_CONFIG_FILE
+        config = json.loads(config_file.read_text()) if config_file.exists() else {}
+        self.max_seq_length = config.get("max_seq_length", 256)
+        self.normalize = config.get("normalize", False)
+        
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = num_threads or min(8, os.cpu_count() or 1)
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(self.model_dir / ONNX_MODEL_FILE),
+            sess_options=opts,
+            providers=["CPUExecutionProvider"]
+        )
+        self._input_names = [i.name for i in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(str(self.model_dir), use_fast=True)
+        
+        logger.info(f"Loaded ONNX encoder from {self.model_dir}")
+    
+    def get_sentence_embedding_dimension(self) -> int:
+        """Get the size of the embeddings produced by the encoder."""
+        return self.session.get_outputs()[0].shape[-1]
+    
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32,
+               normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        """Encode sentences into mean-pooled float32 embeddings."""
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        
+        embeddings = np.empty((len(sentences), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        
+        for start in range(0, len(sentences), batch_size):
+            batch = self.tokenizer(
+                sentences[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            feeds = {name: batch[name].astype(np.int64) for name in self._input_names}
+            hidden = self.session.run(None, feeds)[0]
+            
+            mask = batch["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            embeddings[start:start + batch_size] = pooled
+        
+        if normalize_embeddings or self.normalize:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        
+        return embeddings[0] if single else embeddings
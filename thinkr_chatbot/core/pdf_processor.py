@@ -4,45 +4,175 @@ PDF processing utilities for extracting and chunking text from R course material
 
 import os
 import re
-from typing import List, Dict, Any, Optional
+import json
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from pathlib import Path
 import logging
 from datetime import datetime
 
+from .embedding_cache import content_hash
+
+# pdfplumber and pypdf are only imported if PyMuPDF fails on a file
 try:
-    import pypdf
-    import pdfplumber
     import fitz  # PyMuPDF
 except ImportError as e:
     logging.warning(f"PDF processing libraries not available: {e}")
 
 logger = logging.getLogger(__name__)
 
+# Patterns are compiled once at import rather than on every call
+_CODE_BLOCK_RE = re.compile(r'```r\s*\n(.*?)\n```', re.DOTALL)
+_SENT_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+# MM:SS, HH:MM:SS and HH:MM:SS.mmm in one pass, longest form first
+_TIMESTAMP_RE = re.compile(r'\b\d{1,2}:\d{2}(?::\d{2}(?:\.\d{3})?)?\b')
+
+# Rough sentence length used to turn the character overlap into a sentence count
+_AVG_SENTENCE_CHARS = 50
+
+# Pages shorter than this, or with no letter near the start, are figures or slide numbers
+_MIN_PAGE_CHARS = 10
+_LETTER_SCAN_CHARS = 200
+_LETTER_RE = re.compile(r'[^\W\d_]')
+
+
+def _page_text(text: Optional[str]) -> Optional[str]:
+    """Return the stripped page text, or None if the page has no real text to index."""
+    if not text:
+        return None
+    text = text.strip()
+    if len(text) < _MIN_PAGE_CHARS or not _LETTER_RE.search(text, 0, _LETTER_SCAN_CHARS):
+        return None
+    return text
+
+
+def _extract_and_chunk(pdf_path: str, chunk_size: int, chunk_overlap: int,
+                       chunk_overlap_sentences: int) -> List[Dict[str, Any]]:
+    """Extract and chunk one PDF in a worker process (module-level so it can be pickled)."""
+    processor = PDFProcessor(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                             chunk_overlap_sentences=chunk_overlap_sentences)
+    return processor.process_pdf_file(Path(pdf_path))
+
 
 class PDFProcessor:
     """Process PDF files to extract text and metadata for indexing."""
     
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, batch_size: int = 128,
+                 max_workers: Optional[int] = None, chunk_overlap_sentences: Optional[int] = None,
+                 manifest_path: Optional[str] = None):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        # Number of trailing sentences repeated at the start of the next chunk
+        if chunk_overlap_sentences is None:
+            chunk_overlap_sentences = chunk_overlap // _AVG_SENTENCE_CHARS
+        self.chunk_overlap_sentences = max(0, chunk_overlap_sentences)
+        self.batch_size = batch_size
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # Records which PDF versions are already indexed: {resolved path: [size, mtime]}
+        self.manifest_path = Path(manifest_path) if manifest_path else None
     
-    def extract_text_from_pdf(self, pdf_path: str) -> Dict[str, Any]:
-        """Extract text and metadata from a PDF file."""
+    def load_manifest(self) -> Dict[str, List[int]]:
+        """Load the manifest of already-indexed PDFs (empty if there is none)."""
+        if self.manifest_path is None or not self.manifest_path.exists():
+            return {}
         try:
-            # Try PyMuPDF first (better for complex layouts)
-            return self._extract_with_pymupdf(pdf_path)
+            return json.loads(self.manifest_path.read_text())
         except Exception as e:
-            logger.warning(f"PyMuPDF failed, trying pdfplumber: {e}")
+            logger.warning(f"Ignoring unreadable index manifest {self.manifest_path}: {e}")
+            return {}
+    
+    def save_manifest(self, manifest: Dict[str, List[int]]):
+        """Write the manifest atomically, once the index it describes has been saved."""
+        if self.manifest_path is None:
+            return
+        tmp_file = self.manifest_path.with_name(self.manifest_path.name + ".tmp")
+        tmp_file.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+        os.replace(tmp_file, self.manifest_path)
+    
+    @staticmethod
+    def file_signature(pdf_file: Path) -> List[int]:
+        """Cheap change detector for a PDF: its size and modification time."""
+        stat = pdf_file.stat()
+        return [stat.st_size, int(stat.st_mtime)]
+    
+    def find_stale_files(self, manifest: Dict[str, List[int]]) -> List[str]:
+        """List manifest entries whose PDF has since been modified or removed."""
+        stale = []
+        for path, signature in manifest.items():
+            pdf_file = Path(path)
+            if not pdf_file.exists() or self.file_signature(pdf_file) != signature:
+                stale.append(path)
+        return stale
+    
+    def extract_text_from_pdf(self, pdf_path: str) -> Dict[str, Any]:
+        """Extract text and metadata from a PDF file."""
+        metadata, pages = self._open_pdf(pdf_path)
+        text_content = [{'page': page_num, 'text': text} for page_num, text in pages]
+        
+        return {
+            'text_content': text_content,
+            'metadata': metadata,
+            'filename': os.path.basename(pdf_path)
+        }
+    
+    def _open_pdf(self, pdf_path: str) -> Tuple[Dict[str, Any], Iterator[Tuple[int, str]]]:
+        """Open a PDF with the first library that can read it; pages are read lazily.
+        
+        If that library fails partway through the pages, the rest are read with the next one.
+        """
+        # PyMuPDF first (better for complex layouts), then pdfplumber, then pypdf
+        openers = [
+            ("PyMuPDF", self._open_with_pymupdf),
+            ("pdfplumber", self._open_with_pdfplumber),
+            ("pypdf", self._open_with_pypdf)
+        ]
+        metadata, pages, openers = self._open_with_first(pdf_path, openers)
+        return metadata, self._iter_pages_with_fallback(pdf_path, pages, openers)
+    
+    def _open_with_first(self, pdf_path: str, openers: List[Tuple[str, Any]]
+                         ) -> Tuple[Dict[str, Any], Iterator[Tuple[int, str]], List[Tuple[str, Any]]]:
+        """Open a PDF with the first opener that succeeds, returning its pages and the untried openers."""
+        for i, (name, opener) in enumerate(openers):
             try:
-                return self._extract_with_pdfplumber(pdf_path)
-            except Exception as e2:
-                logger.warning(f"pdfplumber failed, trying pypdf: {e2}")
-                return self._extract_with_pypdf(pdf_path)
+                metadata, pages = opener(pdf_path)
+                return metadata, pages, openers[i + 1:]
+            except Exception as e:
+                if i == len(openers) - 1:
+                    raise
+                logger.warning(f"{name} failed, trying {openers[i + 1][0]}: {e}")
+    
+    def _iter_pages_with_fallback(self, pdf_path: str, pages: Iterator[Tuple[int, str]],
+                                  openers: List[Tuple[str, Any]]) -> Iterator[Tuple[int, str]]:
+        """Yield pages, switching to the next library (after the pages already read) if one fails."""
+        last_page = 0
+        try:
+            while True:
+                try:
+                    for page_num, text in pages:
+                        if page_num > last_page:
+                            yield page_num, text
+                            last_page = page_num
+                    return
+                except Exception as e:
+                    if not openers:
+                        raise
+                    logger.warning(f"Reading {pdf_path} failed after page {last_page}, "
+                                   f"trying {openers[0][0]}: {e}")
+                    pages.close()
+                    _, pages, openers = self._open_with_first(pdf_path, openers)
+        finally:
+            pages.close()
+    
+    def _open_with_pymupdf(self, pdf_path: str) -> Tuple[Dict[str, Any], Iterator[Tuple[int, str]]]:
+        """Open a PDF with PyMuPDF."""
+        doc, metadata = self._open_and_meta(pdf_path)
+        return metadata, self._iter_pages(doc)
     
-    def _extract_with_pymupdf(self, pdf_path: str) -> Dict[str, Any]:
-        """Extract text using PyMuPDF."""
+    def _open_and_meta(self, pdf_path: str) -> Tuple[Any, Dict[str, Any]]:
+        """Open a PDF with PyMuPDF and read its document metadata."""
         doc = fitz.open(pdf_path)
-        text_content = []
         metadata = {
             'title': doc.metadata.get('title', ''),
             'author': doc.metadata.get('author', ''),
@@ -53,58 +183,51 @@ class PDFProcessor:
             'modification_date': doc.metadata.get('modDate', ''),
             'total_pages': len(doc)
         }
+        return doc, metadata
+    
+    def _iter_pages(self, doc) -> Iterator[Tuple[int, str]]:
+        """Yield (page number, text) for each page with text, closing the document at the end."""
+        try:
+            for page_num in range(len(doc)):
+                # Unsorted extraction skips the layout sort; chunking only needs line order
+                text = _page_text(doc.load_page(page_num).get_text("text", sort=False))
+                if text:
+                    yield page_num + 1, text
+        finally:
+            doc.close()
+    
+    def _open_with_pdfplumber(self, pdf_path: str) -> Tuple[Dict[str, Any], Iterator[Tuple[int, str]]]:
+        """Open a PDF with pdfplumber."""
+        import pdfplumber
         
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text = page.get_text()
-            if text.strip():
-                text_content.append({
-                    'page': page_num + 1,
-                    'text': text.strip(),
-                    'bbox': page.rect
-                })
+        pdf = pdfplumber.open(pdf_path)
+        metadata = {
+            'title': pdf.metadata.get('Title', ''),
+            'author': pdf.metadata.get('Author', ''),
+            'subject': pdf.metadata.get('Subject', ''),
+            'creator': pdf.metadata.get('Creator', ''),
+            'producer': pdf.metadata.get('Producer', ''),
+            'total_pages': len(pdf.pages)
+        }
         
-        doc.close()
+        def iter_pages():
+            with pdf:
+                for page_num, page in enumerate(pdf.pages):
+                    text = _page_text(page.extract_text())
+                    if text:
+                        yield page_num + 1, text
+                    # pdfplumber caches parsed layout objects on each page
+                    page.close()
         
-        return {
-            'text_content': text_content,
-            'metadata': metadata,
-            'filename': os.path.basename(pdf_path)
-        }
-    
-    def _extract_with_pdfplumber(self, pdf_path: str) -> Dict[str, Any]:
-        """Extract text using pdfplumber."""
-        with pdfplumber.open(pdf_path) as pdf:
-            text_content = []
-            metadata = {
-                'title': pdf.metadata.get('Title', ''),
-                'author': pdf.metadata.get('Author', ''),
-                'subject': pdf.metadata.get('Subject', ''),
-                'creator': pdf.metadata.get('Creator', ''),
-                'producer': pdf.metadata.get('Producer', ''),
-                'total_pages': len(pdf.pages)
-            }
-            
-            for page_num, page in enumerate(pdf.pages):
-                text = page.extract_text()
-                if text and text.strip():
-                    text_content.append({
-                        'page': page_num + 1,
-                        'text': text.strip(),
-                        'bbox': page.bbox if hasattr(page, 'bbox') else None
-                    })
-            
-            return {
-                'text_content': text_content,
-                'metadata': metadata,
-                'filename': os.path.basename(pdf_path)
-            }
+        return metadata, iter_pages()
     
-    def _extract_with_pypdf(self, pdf_path: str) -> Dict[str, Any]:
-        """Extract text using pypdf (fallback)."""
-        with open(pdf_path, 'rb') as file:
+    def _open_with_pypdf(self, pdf_path: str) -> Tuple[Dict[str, Any], Iterator[Tuple[int, str]]]:
+        """Open a PDF with pypdf (fallback)."""
+        import pypdf
+        
+        file = open(pdf_path, 'rb')
+        try:
             reader = pypdf.PdfReader(file)
-            text_content = []
             metadata = {
                 'title': reader.metadata.get('/Title', '') if reader.metadata else '',
                 'author': reader.metadata.get('/Author', '') if reader.metadata else '',
@@ -113,145 +236,205 @@ class PDFProcessor:
                 'producer': reader.metadata.get('/Producer', '') if reader.metadata else '',
                 'total_pages': len(reader.pages)
             }
-            
-            for page_num, page in enumerate(reader.pages):
-                text = page.extract_text()
-                if text and text.strip():
-                    text_content.append({
-                        'page': page_num + 1,
-                        'text': text.strip(),
-                        'bbox': None
-                    })
-            
-            return {
-                'text_content': text_content,
-                'metadata': metadata,
-                'filename': os.path.basename(pdf_path)
-            }
+        except Exception:
+            file.close()
+            raise
+        
+        def iter_pages():
+            with file:
+                for page_num, page in enumerate(reader.pages):
+                    text = _page_text(page.extract_text())
+                    if text:
+                        yield page_num + 1, text
+        
+        return metadata, iter_pages()
     
     def chunk_text(self, text_content: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Split text content into chunks for vector indexing."""
         chunks = []
-        
         for page_data in text_content:
-            text = page_data['text']
-            page_num = page_data['page']
-            
-            # Split text into sentences first
-            sentences = self._split_into_sentences(text)
-            
-            current_chunk = ""
-            chunk_start_sentence = 0
-            
-            for i, sentence in enumerate(sentences):
-                # Check if adding this sentence would exceed chunk size
-                if len(current_chunk + sentence) > self.chunk_size and current_chunk:
-                    # Save current chunk
-                    chunks.append({
-                        'text': current_chunk.strip(),
-                        'page': page_num,
-                        'start_sentence': chunk_start_sentence,
-                        'end_sentence': i - 1,
-                        'metadata': {
-                            'source': page_data.get('filename', ''),
-                            'page': page_num
-                        }
-                    })
-                    
-                    # Start new chunk with overlap
-                    overlap_sentences = sentences[max(0, i - self.chunk_overlap // 50):i]
-                    current_chunk = " ".join(overlap_sentences)
-                    chunk_start_sentence = max(0, i - self.chunk_overlap // 50)
-                
-                current_chunk += sentence + " "
-            
-            # Add final chunk from this page
-            if current_chunk.strip():
+            chunks.extend(self.chunk_page(page_data['text'], page_data['page'], page_data.get('filename', '')))
+        return chunks
+    
+    def chunk_page(self, text: str, page_num: int, filename: str = '') -> List[Dict[str, Any]]:
+        """Split the text of one page into chunks."""
+        chunks = []
+        
+        # Split text into sentences first
+        sentences = self._split_into_sentences(text)
+        
+        # Collect sentences and track the joined length instead of growing a string
+        parts: List[str] = []
+        cur_len = 0
+        chunk_start_sentence = 0
+        overlap = deque(maxlen=self.chunk_overlap_sentences)
+        
+        for i, sentence in enumerate(sentences):
+            # Check if adding this sentence would exceed chunk size
+            if cur_len + len(sentence) > self.chunk_size and parts:
+                # Save current chunk
+                chunk_content = " ".join(parts).strip()
                 chunks.append({
-                    'text': current_chunk.strip(),
+                    'text': chunk_content,
+                    'content_hash': content_hash(chunk_content),
                     'page': page_num,
                     'start_sentence': chunk_start_sentence,
-                    'end_sentence': len(sentences) - 1,
+                    'end_sentence': i - 1,
                     'metadata': {
-                        'source': page_data.get('filename', ''),
+                        'source': filename,
                         'page': page_num
                     }
                 })
+                
+                # Start new chunk with the last few sentences of this one
+                parts = list(overlap)
+                cur_len = sum(len(s) + 1 for s in parts)
+                chunk_start_sentence = i - len(parts)
+            
+            parts.append(sentence)
+            cur_len += len(sentence) + 1
+            overlap.append(sentence)
+        
+        # Add final chunk from this page
+        if parts:
+            chunk_content = " ".join(parts).strip()
+            chunks.append({
+                'text': chunk_content,
+                'content_hash': content_hash(chunk_content),
+                'page': page_num,
+                'start_sentence': chunk_start_sentence,
+                'end_sentence': len(sentences) - 1,
+                'metadata': {
+                    'source': filename,
+                    'page': page_num
+                }
+            })
         
         return chunks
     
     def _split_into_sentences(self, text: str) -> List[str]:
         """Split text into sentences while preserving R code blocks."""
-        # Pattern to match R code blocks
-        code_pattern = r'```r\s*\n(.*?)\n```'
+        sentences: List[str] = []
+        pos = 0
         
-        # Find all code blocks
-        code_blocks = re.findall(code_pattern, text, re.DOTALL)
+        # Only the prose between code blocks goes through the sentence splitter
+        for match in _CODE_BLOCK_RE.finditer(text):
+            sentences.extend(s for s in (p.strip() for p in _SENT_SPLIT_RE.split(text[pos:match.start()])) if s)
+            
+            # Keep the whole block, fences included, with the sentence that introduces it
+            code_block = match.group(0)
+            if sentences:
+                sentences[-1] = f"{sentences[-1]} {code_block}"
+            else:
+                sentences.append(code_block)
+            pos = match.end()
         
-        # Replace code blocks with placeholders
-        text_with_placeholders = re.sub(code_pattern, 'CODE_BLOCK_PLACEHOLDER', text, flags=re.DOTALL)
+        sentences.extend(s for s in (p.strip() for p in _SENT_SPLIT_RE.split(text[pos:])) if s)
+        return sentences
+    
+    def process_pdf_file(self, pdf_file: Path) -> List[Dict[str, Any]]:
+        """Extract and chunk a single PDF file, tagging chunks with its metadata."""
+        logger.info(f"Processing {pdf_file.name}")
+        metadata, pages = self._open_pdf(str(pdf_file))
         
-        # Split into sentences
-        sentences = re.split(r'(?<=[.!?])\s+', text_with_placeholders)
+        # Chunk each page as it is read so only one page of text is held at a time
+        chunks = []
+        try:
+            for page_num, text in pages:
+                chunks.extend(self.chunk_page(text, page_num, pdf_file.name))
+        finally:
+            pages.close()
         
-        # Restore code blocks
-        code_index = 0
-        for i, sentence in enumerate(sentences):
-            if 'CODE_BLOCK_PLACEHOLDER' in sentence:
-                if code_index < len(code_blocks):
-                    sentences[i] = sentence.replace('CODE_BLOCK_PLACEHOLDER', code_blocks[code_index])
-                    code_index += 1
+        # Add metadata to each chunk
+        for chunk in chunks:
+            chunk['metadata'].update({
+                'title': metadata.get('title', ''),
+                'author': metadata.get('author', ''),
+                'subject': metadata.get('subject', ''),
+                'filename': pdf_file.name
+            })
         
-        return [s.strip() for s in sentences if s.strip()]
+        logger.info(f"Created {len(chunks)} chunks from {pdf_file.name}")
+        return chunks
     
-    def process_pdf_directory(self, pdf_dir: str) -> List[Dict[str, Any]]:
-        """Process all PDF files in a directory."""
+    def iter_chunk_batches(self, pdf_dir: str, batch_size: Optional[int] = None,
+                           manifest: Optional[Dict[str, List[int]]] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Yield chunks from all PDFs in a directory in groups of batch_size, in order.
+        
+        When a manifest is given, PDFs whose size and mtime match their entry are
+        skipped, and every processed PDF is recorded in it.
+        """
         pdf_dir = Path(pdf_dir)
-        all_chunks = []
+        batch_size = batch_size or self.batch_size
         
         if not pdf_dir.exists():
             logger.error(f"PDF directory does not exist: {pdf_dir}")
-            return all_chunks
+            return
         
-        pdf_files = list(pdf_dir.glob("*.pdf"))
+        # Symlinks or duplicate matches that resolve to the same PDF are processed once
+        by_key = {}
+        for pdf_file in sorted(pdf_dir.glob("*.pdf")):
+            by_key.setdefault(str(pdf_file.resolve()), pdf_file)
+        pdf_files = list(by_key.values())
+        
+        signatures = {}
+        if manifest is not None:
+            changed = []
+            for key, pdf_file in by_key.items():
+                signatures[key] = self.file_signature(pdf_file)
+                if manifest.get(key) != signatures[key]:
+                    changed.append(pdf_file)
+            if len(changed) < len(pdf_files):
+                logger.info(f"Skipping {len(pdf_files) - len(changed)} unchanged PDF files")
+            pdf_files = changed
         logger.info(f"Found {len(pdf_files)} PDF files to process")
         
-        for pdf_file in pdf_files:
-            try:
-                logger.info(f"Processing {pdf_file.name}")
-                extracted_data = self.extract_text_from_pdf(str(pdf_file))
-                chunks = self.chunk_text(extracted_data['text_content'])
-                
-                # Add metadata to each chunk
-                for chunk in chunks:
-                    chunk['metadata'].update({
-                        'title': extracted_data['metadata'].get('title', ''),
-                        'author': extracted_data['metadata'].get('author', ''),
-                        'subject': extracted_data['metadata'].get('subject', ''),
-                        'filename': extracted_data['filename']
-                    })
-                
-                all_chunks.extend(chunks)
-                logger.info(f"Created {len(chunks)} chunks from {pdf_file.name}")
-                
-            except Exception as e:
-                logger.error(f"Error processing {pdf_file}: {e}")
-                continue
+        # Batches span file boundaries so the encoder always sees full batches
+        batch = []
+        for pdf_file, chunks in self._iter_file_chunks(pdf_files):
+            if manifest is not None:
+                key = str(pdf_file.resolve())
+                manifest[key] = signatures[key]
+            for chunk in chunks:
+                batch.append(chunk)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
         
+        if batch:
+            yield batch
+    
+    def _iter_file_chunks(self, pdf_files: List[Path]) -> Iterator[Tuple[Path, List[Dict[str, Any]]]]:
+        """Yield (file, chunks) in order for each file that could be processed, extracting in parallel."""
+        workers = min(self.max_workers, len(pdf_files))
+        if workers <= 1:
+            for pdf_file in pdf_files:
+                try:
+                    yield pdf_file, self.process_pdf_file(pdf_file)
+                except Exception as e:
+                    logger.error(f"Error processing {pdf_file}: {e}")
+            return
+        
+        # Spawned workers avoid forking a parent that may hold torch/OpenMP threads
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [
+                pool.submit(_extract_and_chunk, str(pdf_file), self.chunk_size, self.chunk_overlap,
+                            self.chunk_overlap_sentences)
+                for pdf_file in pdf_files
+            ]
+            # Collect in submission order so chunk order stays deterministic
+            for pdf_file, future in zip(pdf_files, futures):
+                try:
+                    yield pdf_file, future.result()
+                except Exception as e:
+                    logger.error(f"Error processing {pdf_file}: {e}")
+    
+    def process_pdf_directory(self, pdf_dir: str) -> List[Dict[str, Any]]:
+        """Process all PDF files in a directory."""
+        all_chunks = [chunk for batch in self.iter_chunk_batches(pdf_dir) for chunk in batch]
         logger.info(f"Total chunks created: {len(all_chunks)}")
         return all_chunks
     
     def extract_timestamps(self, text: str) -> List[str]:
         """Extract timestamps from text (e.g., "12:34", "1:23:45")."""
-        timestamp_patterns = [
-            r'\b\d{1,2}:\d{2}\b',  # MM:SS
-            r'\b\d{1,2}:\d{2}:\d{2}\b',  # HH:MM:SS
-            r'\b\d{1,2}:\d{2}:\d{2}\.\d{3}\b',  # HH:MM:SS.mmm
-        ]
-        
-        timestamps = []
-        for pattern in timestamp_patterns:
-            matches = re.findall(pattern, text)
-            timestamps.extend(matches)
-        
-        return timestamps 
\ No newline at end of file
+        return _TIMESTAMP_RE.findall(text)
\ No newline at end of file
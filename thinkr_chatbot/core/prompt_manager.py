@@ -2,9 +2,11 @@
 Prompt management for the ThinkR chatbot.
 """
 
-from typing import List, Dict, Any
+from typing import Deque, List, Dict, Any, Optional
 import os
+from collections import deque
 from dataclasses import dataclass
+from itertools import islice
 
 
 @dataclass
@@ -12,15 +14,16 @@ class ChatMessage:
     """Represents a chat message with role and content."""
     role: str
     content: str
-    timestamp: str = None
+    timestamp: Optional[str] = None
 
 
 class PromptManager:
     """Manages system prompts and message formatting for the ThinkR chatbot."""
     
-    def __init__(self):
+    def __init__(self, max_history: int = 20) -> None:
         self.system_prompt = self._get_system_prompt()
-        self.conversation_history: List[ChatMessage] = []
+        # Bounded so long sessions don't grow without limit; oldest messages drop off first
+        self.conversation_history: Deque[ChatMessage] = deque(maxlen=max_history)
     
     def _get_system_prompt(self) -> str:
         """Get the main system prompt for the R tutor."""
@@ -48,7 +51,7 @@ Remember:
 
 Context from course materials will be provided to help you give more accurate and relevant responses."""
 
-    def get_messages_with_context(self, user_message: str, context: str = None) -> List[Dict[str, str]]:
+    def get_messages_with_context(self, user_message: str, context: Optional[str] = None) -> List[Dict[str, str]]:
         """Format messages for the LLM with context."""
         messages = [{"role": "system", "content": self.system_prompt}]
         
@@ -61,21 +64,22 @@ Context from course materials will be provided to help you give more accurate an
         
         return messages
     
-    def add_to_history(self, role: str, content: str, timestamp: str = None):
+    def add_to_history(self, role: str, content: str, timestamp: Optional[str] = None) -> None:
         """Add a message to conversation history."""
         message = ChatMessage(role=role, content=content, timestamp=timestamp)
         self.conversation_history.append(message)
     
     def get_recent_history(self, max_messages: int = 10) -> List[Dict[str, str]]:
         """Get recent conversation history for context."""
-        recent_messages = self.conversation_history[-max_messages:] if self.conversation_history else []
+        start = max(0, len(self.conversation_history) - max_messages)
+        recent_messages = islice(self.conversation_history, start, None)
         return [{"role": msg.role, "content": msg.content} for msg in recent_messages]
     
-    def clear_history(self):
+    def clear_history(self) -> None:
         """Clear conversation history."""
         self.conversation_history.clear()
     
-    def format_response_with_references(self, response: str, references: List[Dict[str, Any]] = None) -> str:
+    def format_response_with_references(self, response: str, references: Optional[List[Dict[str, Any]]] = None) -> str:
         """Format the response with module references and timestamps."""
         formatted_response = response
         
@@ -0,0 +1,95 @@
+"""
+Semantic cache that reuses results for queries whose embeddings are nearly identical.
+"""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+class ProximityCache:
+    """Fixed-size cache looked up by cosine similarity of query embeddings, with LRU eviction."""
+    
+    def __init__(self, capacity: int = 128, threshold: float = 0.95):
+        self.capacity = capacity
+        self.threshold = threshold
+        # Unit-norm query embeddings, one row per slot; allocated on the first set
+        self._keys: Optional[np.ndarray] = None
+        self._vals: List[Any] = []
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+        self._clock = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        """Flatten to float32 and scale to unit length so dot products are cosines."""
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+    
+    def get(self, vector: np.ndarray) -> Optional[Any]:
+        """Return the value stored for the most similar cached query, if it is close enough."""
+        query = self._normalize(vector)
+        
+        with self._lock:
+            size = len(self._vals)
+            if size == 0 or self._keys.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            
+            # One matrix-vector product scores every cached query
+            scores = self._keys[:size] @ query
+            best = int(scores.argmax())
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            
+            self._clock += 1
+            self._last_used[best] = self._clock
+            self.hits += 1
+            return self._vals[best]
+    
+    def set(self, vector: np.ndarray, value: Any):
+        """Store a value for a query embedding, evicting the least recently used slot when full."""
+        query = self._normalize(vector)
+        
+        with self._lock:
+            if self._keys is None or self._keys.shape[1] != query.shape[0]:
+                self._keys = np.zeros((self.capacity, query.shape[0]), dtype=np.float32)
+                self._vals = []
+            
+            if len(self._vals) < self.capacity:
+                slot = len(self._vals)
+                self._vals.append(value)
+            else:
+                slot = int(self._last_used.argmin())
+                self._vals[slot] = value
+            
+            self._keys[slot] = query
+            self._clock += 1
+            self._last_used[slot] = self._clock
+    
+    def clear(self):
+        """Drop all cached entries (e.g. after the index changes)."""
+        with self._lock:
+            self._vals = []
+            self._last_used[:] = 0
+    
+    def __len__(self) -> int:
+        return len(self._vals)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get hit/miss statistics for the cache."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._vals),
+                "capacity": self.capacity,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
@@ -0,0 +1,107 @@
+"""
+Persistent semantic cache of chatbot answers, so paraphrased questions skip retrieval and the LLM.
+"""
+
+import pickle
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+
+from .proximity_cache import ProximityCache
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache(ProximityCache):
+    """ProximityCache of answers keyed by the question embedding, backed by a SQLite log.
+    
+    Each answer is appended as one row, so storing it costs a single insert rather than
+    rewriting the cache, and several processes can share the database. On start-up the
+    newest ``capacity`` answers are loaded; older rows are trimmed as new ones arrive.
+    """
+    
+    def __init__(self, path: Optional[str] = None, capacity: int = 5000, threshold: float = 0.87):
+        super().__init__(capacity=capacity, threshold=threshold)
+        self.path = Path(path) if path else None
+        self._conn = None
+        
+        if self.path is not None:
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    vector BLOB NOT NULL,
+                    value BLOB NOT NULL
+                )
+            """)
+            self.load()
+    
+    def set(self, vector: np.ndarray, value: Any):
+        """Store an answer and append it to the database."""
+        super().set(vector, value)
+        if self._conn is None:
+            return
+        
+        try:
+            row = (self._normalize(vector).tobytes(), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+            with self._lock, self._conn:
+                self._conn.execute("INSERT INTO responses (vector, value) VALUES (?, ?)", row)
+                # Keep only as many rows as load() can use
+                self._conn.execute(
+                    "DELETE FROM responses WHERE id <= "
+                    "(SELECT id FROM responses ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                    (self.capacity,)
+                )
+        except Exception as e:
+            logger.error(f"Failed to save cached response: {e}")
+    
+    def clear(self):
+        """Drop all cached answers (e.g. after the index changes), on disk too."""
+        super().clear()
+        if self._conn is None:
+            return
+        
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+    
+    def load(self):
+        """Load the newest cached answers from the database, skipping rows that can't be read."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT vector, value FROM responses ORDER BY id DESC LIMIT ?", (self.capacity,)
+            ).fetchall()
+        
+        keys, values = [], []
+        for vector, value in reversed(rows):
+            # Answers keyed by another embedding model can't be compared with new queries
+            if len(vector) != len(rows[0][0]):
+                continue
+            try:
+                values.append(pickle.loads(value))
+            except Exception as e:
+                logger.warning(f"Skipping unreadable cached response: {e}")
+                continue
+            keys.append(np.frombuffer(vector, dtype=np.float32))
+        
+        with self._lock:
+            self._keys = None
+            self._vals = values
+            self._last_used[:] = 0
+            if values:
+                self._keys = np.zeros((self.capacity, keys[0].shape[0]), dtype=np.float32)
+                self._keys[:len(keys)] = np.stack(keys)
+                # Oldest rows first, so they are the first to be evicted
+                self._last_used[:len(values)] = np.arange(1, len(values) + 1)
+            self._clock = len(values)
+        
+        logger.info(f"Loaded {len(values)} cached responses")
+    
+    def close(self):
+        """Close the database connection."""
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
@@ -0,0 +1,135 @@
+"""
+On-disk store of chunk texts, addressed by their position in the vector index.
+"""
+
+import os
+import zlib
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class TextStore:
+    """Append-only file of individually compressed texts plus an (offset, length) table.
+    
+    Only the table is held in memory; a text is read and decompressed when it is asked for.
+    Like the memory-mapped index, the records file stays open, so a process keeps reading
+    the texts it loaded while another one replaces them, until it reloads.
+    """
+    
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.offsets_path = self.path.with_suffix(".offsets.npy")
+        # After a clear, records are rewritten here and swapped in by save()
+        self.tmp_path = self.path.with_suffix(".bin.tmp")
+        self._offsets = np.zeros((0, 2), dtype=np.int64)
+        self._reader: Optional[int] = None
+        self._rewriting = False
+        self.load()
+    
+    def __len__(self) -> int:
+        return len(self._offsets)
+    
+    def __del__(self):
+        self._close_reader()
+    
+    def load(self):
+        """Read the offset table saved with the index, starting empty if there is none."""
+        self._offsets = np.zeros((0, 2), dtype=np.int64)
+        self._rewriting = False
+        self._open_reader()
+        if not self.offsets_path.exists():
+            return
+        
+        try:
+            self._offsets = np.load(self.offsets_path)
+        except Exception as e:
+            logger.warning(f"Failed to load text offsets from {self.offsets_path}: {e}")
+    
+    def _open_reader(self):
+        """(Re)open the saved records file for reading."""
+        self._close_reader()
+        if self.path.exists():
+            self._reader = os.open(self.path, os.O_RDONLY)
+    
+    def close(self):
+        """Close the records file (e.g. once a reloaded store has replaced this one)."""
+        self._close_reader()
+    
+    def _close_reader(self):
+        if getattr(self, "_reader", None) is not None:
+            os.close(self._reader)
+            self._reader = None
+    
+    def append(self, texts: List[str], start_index: int):
+        """Append texts for documents start_index, start_index + 1, ...
+        
+        Documents indexed before texts were stored get empty records, so positions keep
+        matching the vector index.
+        """
+        records = np.zeros((max(0, start_index - len(self)) + len(texts), 2), dtype=np.int64)
+        # Appending leaves existing records untouched, so readers of the saved file are unaffected
+        with open(self.tmp_path if self._rewriting else self.path, 'ab') as f:
+            # Anything past the last saved offset is an unsaved append, left unreferenced
+            position = f.seek(0, os.SEEK_END)
+            for row, text in enumerate(texts, start=len(records) - len(texts)):
+                data = zlib.compress(text.encode("utf-8"))
+                f.write(data)
+                records[row] = (position, len(data))
+                position += len(data)
+        
+        self._offsets = np.concatenate([self._offsets[:start_index], records])
+        if self._reader is None and not self._rewriting:
+            self._open_reader()
+    
+    def get(self, index: int) -> Optional[str]:
+        """Get the text of one document, or None if it was not stored."""
+        return self.get_many([index])[0]
+    
+    def get_many(self, indices: List[int]) -> List[Optional[str]]:
+        """Get the texts of several documents."""
+        texts: List[Optional[str]] = [None] * len(indices)
+        wanted = [
+            (i, index) for i, index in enumerate(indices)
+            if 0 <= index < len(self) and self._offsets[index, 1]
+        ]
+        if not wanted or (self._reader is None and not self._rewriting):
+            return texts
+        
+        try:
+            fd = os.open(self.tmp_path, os.O_RDONLY) if self._rewriting else self._reader
+            try:
+                for i, index in wanted:
+                    offset, length = self._offsets[index].tolist()
+                    texts[i] = zlib.decompress(os.pread(fd, length, offset)).decode("utf-8")
+            finally:
+                if self._rewriting:
+                    os.close(fd)
+        except (OSError, zlib.error) as e:
+            logger.warning(f"Failed to read document texts from {self.path}: {e}")
+        
+        return texts
+    
+    def save(self):
+        """Swap in rewritten records, then the offset table, each with an atomic replace."""
+        if self._rewriting:
+            self.tmp_path.touch()
+            os.replace(self.tmp_path, self.path)
+            self._rewriting = False
+            self._open_reader()
+        
+        tmp_offsets_path = self.offsets_path.with_suffix(".tmp")
+        with open(tmp_offsets_path, 'wb') as f:
+            np.save(f, self._offsets)
+        os.replace(tmp_offsets_path, self.offsets_path)
+    
+    def clear(self):
+        """Drop all texts; the saved file is only replaced by the next save()."""
+        self._offsets = np.zeros((0, 2), dtype=np.int64)
+        self._rewriting = True
+        with open(self.tmp_path, 'wb'):
+            pass
@@ -4,161 +4,624 @@ FAISS vector store for efficient similarity search and retrieval of R course mat
 
 import os
 import pickle
+import functools
 import logging
+import threading
 from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
 from pathlib import Path
 
+# Tokenizer worker threads would compete with torch and FAISS for the same cores
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
 try:
     import faiss
+    import torch
     from sentence_transformers import SentenceTransformer
 except ImportError as e:
     logging.error(f"FAISS or sentence-transformers not available: {e}")
     raise
 
+# Optional: metadata is stored as columnar parquet when pyarrow is installed, else pickled
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from .embedding_cache import EmbeddingCache, content_hash
+from .text_store import TextStore
+from .vector_store_kernels import filter_topk
+
 logger = logging.getLogger(__name__)
 
+# FAISS parallelizes search with OpenMP; a handful of threads is the sweet spot
+# and leaves cores for the embedding model
+faiss.omp_set_num_threads(int(os.getenv("FAISS_NUM_THREADS", min(8, os.cpu_count() or 1))))
+
+# Same cap for CPU embedding; more threads than this rarely helps a small encoder
+torch.set_num_threads(int(os.getenv("TORCH_NUM_THREADS", min(8, os.cpu_count() or 1))))
+
+# Below this many documents exact search is fast enough and gives perfect recall
+HNSW_MIN_DOCUMENTS = 10_000
+
+# Above this many documents an IVF index (k-means cells, only nprobe of them scanned)
+# keeps query cost low without HNSW's per-vector graph memory
+IVF_MIN_DOCUMENTS = 50_000
+
+# Number of IVF cells scanned per query; higher is slower but more accurate
+DEFAULT_NPROBE = int(os.getenv("FAISS_NPROBE", 8))
+
+# "auto" picks flat/HNSW/IVF by corpus size; "ivfpq" opts into product-quantized storage
+DEFAULT_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto")
+
+# IVFPQ stores each vector as PQ_M one-byte codes (48 bytes instead of 1536 for 384 dims);
+# PQ_M has to divide the embedding dimension
+DEFAULT_PQ_M = int(os.getenv("FAISS_PQ_M", 48))
+PQ_NBITS = 8
+
+# Training 256 centroids per sub-quantizer needs plenty of vectors; smaller
+# "ivfpq" stores stay exact until they reach this size
+PQ_MIN_DOCUMENTS = 10_000
+
+# Documents encoded per encoder call when indexing; bounds the encoder's output
+# buffers to one chunk however large the collection is
+ENCODE_CHUNK_SIZE = 1024
+
+# bfloat16 CPU encoding only pays off on CPUs with native bf16 matmuls (AVX512-BF16/AMX)
+# and is slower elsewhere, so it is opt-in
+ENCODER_CPU_BF16 = os.getenv("ENCODER_CPU_BF16", "0") == "1"
+
+# Index layouts FAISS can run on GPU (it has no GPU HNSW)
+GPU_INDEX_KINDS = ("flat", "ivf", "ivfpq")
+
+
+# Sentence transformers already loaded in this process, shared by every VectorStore
+# (e.g. one per chatbot) so each model is only loaded once
+_encoder_cache: Dict[str, SentenceTransformer] = {}
+_encoder_cache_lock = threading.Lock()
+
+
+def _load_sentence_transformer(model_name: str) -> SentenceTransformer:
+    """Load a sentence transformer, or reuse the one already loaded in this process."""
+    with _encoder_cache_lock:
+        if model_name in _encoder_cache:
+            return _encoder_cache[model_name]
+        
+        try:
+            encoder = SentenceTransformer(model_name)
+            logger.info(f"Loaded sentence transformer model: {model_name}")
+        except Exception as e:
+            logger.error(f"Failed to load sentence transformer model: {e}")
+            raise
+        
+        # Half precision doubles tensor-core throughput on GPU; FAISS still gets float32
+        if torch.cuda.is_available():
+            dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+            encoder = encoder.to(dtype=dtype)
+            logger.info(f"Running sentence transformer on GPU in {dtype}")
+        elif ENCODER_CPU_BF16:
+            torch.set_float32_matmul_precision("medium")
+            encoder = encoder.to(dtype=torch.bfloat16)
+            logger.info("Running sentence transformer on CPU in torch.bfloat16")
+        
+        _encoder_cache[model_name] = encoder
+        return encoder
+
+
+def _length_order(texts: List[str]) -> np.ndarray:
+    """Order in which to encode texts so each batch holds similar lengths and little padding."""
+    return np.argsort([len(text) for text in texts], kind='stable')
+
+
+def _normalize_rows(embeddings: np.ndarray) -> np.ndarray:
+    """Scale embedding rows to unit length in place, so inner product is cosine similarity."""
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    faiss.normalize_L2(embeddings)
+    return embeddings
+
 
 class VectorStore:
     """FAISS-based vector store for R course materials."""
     
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2", index_path: str = "./data/vector_db"):
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", index_path: str = "./data/vector_db",
+                 onnx_model_dir: Optional[str] = None, index_type: str = DEFAULT_INDEX_TYPE,
+                 use_embedding_cache: bool = True, nprobe: int = DEFAULT_NPROBE,
+                 pq_m: int = DEFAULT_PQ_M):
         self.model_name = model_name
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.pq_m = pq_m
         self.index_path = Path(index_path)
         self.index_path.mkdir(parents=True, exist_ok=True)
         
-        # Initialize the sentence transformer model
-        try:
-            self.encoder = SentenceTransformer(model_name)
-            logger.info(f"Loaded sentence transformer model: {model_name}")
-        except Exception as e:
-            logger.error(f"Failed to load sentence transformer model: {e}")
-            raise
+        # Initialize the encoder, preferring the int8 ONNX export when one is configured
+        onnx_model_dir = onnx_model_dir or os.getenv("ONNX_ENCODER_DIR")
+        self.encoder = self._load_onnx_encoder(onnx_model_dir) if onnx_model_dir else None
+        
+        if self.encoder is None:
+            self.encoder = _load_sentence_transformer(model_name)
+        
+        # Per-instance cache for exact repeats of a query string (e.g. "help")
+        self._embed_text = functools.lru_cache(maxsize=1024)(self._embed_text_uncached)
+        
+        # Re-indexing only encodes chunks whose text has not been embedded before
+        self.embedding_cache = self._open_embedding_cache(onnx_model_dir) if use_embedding_cache else None
+        
+        # With a FAISS GPU build and a visible GPU, searches run on a GPU copy of the index
+        self._gpu_resources = self._init_gpu()
+        self._gpu_index = None
         
         # Initialize FAISS index
         self.dimension = self.encoder.get_sentence_embedding_dimension()
-        self.index = faiss.IndexFlatIP(self.dimension)  # Inner product for cosine similarity
+        self.index_kind = self._resolve_index_type(0)
+        self.index = self._create_index(self.index_kind)
+        self._index_mmapped = False
         
-        # Store metadata
+        # Held by searches (not by encoding) and by reload_index while it swaps in the loaded
+        # state, so a search never sees the new index with the old metadata or texts
+        self.state_lock = threading.RLock()
+        
+        # Store metadata, and chunk texts on disk for building LLM context
         self.metadata = []
-        self.chunks = []
+        self.text_store = TextStore(self.index_path / "texts.bin")
+        self._loaded_version = None
         
         # Load existing index if available
         self._load_existing_index()
     
-    def _load_existing_index(self):
-        """Load existing FAISS index and metadata if available."""
-        index_file = self.index_path / "faiss_index.bin"
-        metadata_file = self.index_path / "metadata.pkl"
+    def _load_onnx_encoder(self, model_dir: str):
+        """Load the quantized ONNX encoder, or return None to fall back to PyTorch."""
+        try:
+            from .onnx_encoder import ORTSentenceEncoder
+            return ORTSentenceEncoder(model_dir)
+        except Exception as e:
+            logger.warning(f"Failed to load ONNX encoder from {model_dir}, using sentence-transformers: {e}")
+            return None
+    
+    def _open_embedding_cache(self, onnx_model_dir: Optional[str]) -> Optional[EmbeddingCache]:
+        """Open the on-disk embedding cache, keyed to the encoder that fills it."""
+        encoder_id = self.model_name
+        if onnx_model_dir and not isinstance(self.encoder, SentenceTransformer):
+            encoder_id = f"{self.model_name}@onnx:{onnx_model_dir}"
+        
+        try:
+            return EmbeddingCache(self.index_path / "embedding_cache.sqlite", encoder_id)
+        except Exception as e:
+            logger.warning(f"Embedding cache unavailable, encoding all documents: {e}")
+            return None
+    
+    def _init_gpu(self):
+        """Create FAISS GPU resources if a GPU build and device are available (FAISS_USE_GPU=0 disables)."""
+        if os.getenv("FAISS_USE_GPU", "1") == "0" or not hasattr(faiss, "StandardGpuResources"):
+            return None
+        
+        try:
+            if faiss.get_num_gpus() < 1:
+                return None
+            resources = faiss.StandardGpuResources()
+            logger.info("FAISS GPU available, searching on GPU")
+            return resources
+        except Exception as e:
+            logger.warning(f"FAISS GPU unavailable, searching on CPU: {e}")
+            return None
+    
+    @property
+    def index(self):
+        """The canonical CPU index, which is the one saved to disk."""
+        return self._index
+    
+    @index.setter
+    def index(self, index):
+        self._index = index
+        # The GPU copy belonged to the replaced index
+        self._gpu_index = None
+    
+    def _search_index(self):
+        """Index to search: a GPU copy of flat and IVF indexes when a GPU is available."""
+        if self._gpu_resources is None or self.index_kind not in GPU_INDEX_KINDS or not self.index.ntotal:
+            return self.index
         
-        if index_file.exists() and metadata_file.exists():
+        if self._gpu_index is None:
             try:
-                # Load FAISS index
-                self.index = faiss.read_index(str(index_file))
-                
-                # Load metadata
-                with open(metadata_file, 'rb') as f:
-                    self.metadata = pickle.load(f)
-                
-                logger.info(f"Loaded existing index with {len(self.metadata)} documents")
-                
+                self._gpu_index = faiss.index_cpu_to_gpu(self._gpu_resources, 0, self.index)
             except Exception as e:
-                logger.error(f"Failed to load existing index: {e}")
-                # Reinitialize if loading fails
-                self.index = faiss.IndexFlatIP(self.dimension)
-                self.metadata = []
+                logger.warning(f"Could not move index to GPU, searching on CPU: {e}")
+                self._gpu_resources = None
+                return self.index
+        
+        return self._gpu_index
     
-    def _save_index(self):
+    def _resolve_index_type(self, n_documents: int) -> str:
+        """Pick the FAISS index layout for a corpus of the given size."""
+        if self.index_type == "ivfpq" and n_documents < PQ_MIN_DOCUMENTS:
+            return "flat"
+        if self.index_type != "auto":
+            return self.index_type
+        if n_documents >= IVF_MIN_DOCUMENTS:
+            return "ivf"
+        return "hnsw" if n_documents >= HNSW_MIN_DOCUMENTS else "flat"
+    
+    def _create_index(self, index_kind: str, n_documents: int = 0):
+        """Create an empty FAISS index (inner product for cosine similarity)."""
+        if index_kind == "ivf":
+            # About sqrt(N) cells; the index has to be trained before vectors are added
+            nlist = max(1, int(np.sqrt(n_documents)))
+            quantizer = faiss.IndexFlatIP(self.dimension)
+            index = faiss.IndexIVFFlat(quantizer, self.dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.nprobe = self.nprobe
+            return index
+        if index_kind == "ivfpq":
+            nlist = max(1, int(np.sqrt(n_documents)))
+            quantizer = faiss.IndexFlatIP(self.dimension)
+            index = faiss.IndexIVFPQ(quantizer, self.dimension, nlist, self._pq_subquantizers(),
+                                     PQ_NBITS, faiss.METRIC_INNER_PRODUCT)
+            index.nprobe = self.nprobe
+            return index
+        if index_kind == "hnsw":
+            index = faiss.IndexHNSWFlat(self.dimension, 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 200
+            index.hnsw.efSearch = 64
+            return index
+        if index_kind == "flat":
+            return faiss.IndexFlatIP(self.dimension)
+        raise ValueError(f"Unknown index type: {index_kind}")
+    
+    def _pq_subquantizers(self) -> int:
+        """Largest number of PQ sub-quantizers up to pq_m that divides the embedding dimension."""
+        m = max(1, min(self.pq_m, self.dimension))
+        while self.dimension % m:
+            m -= 1
+        if m != self.pq_m:
+            logger.warning(f"PQ m={self.pq_m} does not divide dimension {self.dimension}, using m={m}")
+        return m
+    
+    def _rebuild_index(self, index_kind: str, new_vectors: np.ndarray):
+        """Move the stored vectors into a new index layout, training it on old and new vectors."""
+        logger.info(f"Rebuilding index as {index_kind} for {self.index.ntotal} vectors")
+        vectors = self.index.reconstruct_n(0, self.index.ntotal) if self.index.ntotal else None
+        
+        self.index = self._create_index(index_kind, len(self.metadata) + len(new_vectors))
+        self.index_kind = index_kind
+        self._index_mmapped = False
+        if not self.index.is_trained:
+            training = new_vectors if vectors is None else np.concatenate([vectors, new_vectors])
+            if self._gpu_resources is not None and index_kind in GPU_INDEX_KINDS:
+                # k-means training dominates an IVF rebuild and is far faster on GPU
+                gpu_index = faiss.index_cpu_to_gpu(self._gpu_resources, 0, self.index)
+                gpu_index.train(training)
+                self.index = faiss.index_gpu_to_cpu(gpu_index)
+            else:
+                self.index.train(training)
+        if vectors is not None:
+            self.index.add(vectors)
+    
+    def _load_existing_index(self):
+        """Load existing FAISS index and metadata if available.
+        
+        Everything is read first and then swapped in together, so searches running
+        meanwhile keep using the previous index, metadata and texts.
+        """
+        index_file = self.index_path / "faiss_index.bin"
+        metadata_file = self._existing_metadata_file()
+        # Taken before reading, so a save that lands mid-load is picked up by the next check
+        version = self._saved_version()
+        
+        if not index_file.exists() or metadata_file is None:
+            self._loaded_version = version
+            return
+        
+        old_text_store = self.text_store
+        try:
+            # Load FAISS index
+            index, mmapped = self._read_index(index_file)
+            if isinstance(index, faiss.IndexHNSWFlat):
+                index_kind = "hnsw"
+                index.hnsw.efSearch = 64
+            elif isinstance(index, faiss.IndexIVFPQ):
+                index_kind = "ivfpq"
+                index.nprobe = self.nprobe
+            elif isinstance(index, faiss.IndexIVF):
+                index_kind = "ivf"
+                index.nprobe = self.nprobe
+            else:
+                index_kind = "flat"
+            
+            # Load metadata and open the texts saved with them
+            metadata = self._read_metadata(metadata_file)
+            text_store = TextStore(old_text_store.path)
+            
+            logger.info(f"Loaded existing index with {len(metadata)} documents")
+            
+        except Exception as e:
+            logger.error(f"Failed to load existing index: {e}")
+            # Reinitialize if loading fails
+            index_kind = self._resolve_index_type(0)
+            index = self._create_index(index_kind)
+            mmapped = False
+            metadata = []
+            text_store = old_text_store
+        
+        with self.state_lock:
+            self.index = index
+            self.index_kind = index_kind
+            self._index_mmapped = mmapped
+            self.metadata = metadata
+            self.text_store = text_store
+            self._loaded_version = version
+        
+        # No search can be reading the old texts once the new ones are in place
+        if text_store is not old_text_store:
+            old_text_store.close()
+    
+    def _read_index(self, index_file: Path) -> Tuple[Any, bool]:
+        """Memory-map the index so workers share the OS page cache instead of each copying it.
+        
+        Returns the index and whether it is memory-mapped.
+        """
+        try:
+            return faiss.read_index(str(index_file), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY), True
+        except Exception as e:
+            logger.warning(f"Could not memory-map index, loading it into memory: {e}")
+            return faiss.read_index(str(index_file)), False
+    
+    def _ensure_writable(self):
+        """Load a private copy of a memory-mapped IVF index, whose inverted lists are read-only."""
+        if self._index_mmapped and self.index_kind in ("ivf", "ivfpq"):
+            self.index = faiss.read_index(str(self.index_path / "faiss_index.bin"))
+            self.index.nprobe = self.nprobe
+            self._index_mmapped = False
+    
+    def reload_index(self):
+        """Reload the index from disk (e.g. after another process rebuilt it)."""
+        self._load_existing_index()
+    
+    def _saved_version(self) -> Optional[Tuple[int, int]]:
+        """Identify the last completed save by the text offsets file, which save_index replaces last."""
+        try:
+            stat = self.text_store.offsets_path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+    
+    def index_changed_on_disk(self) -> bool:
+        """Whether another process saved an index since this one was loaded or saved."""
+        return self._saved_version() != self._loaded_version
+    
+    def save_index(self):
         """Save FAISS index and metadata to disk."""
         try:
-            # Save FAISS index
+            # Write to temporary files and swap them in, so processes that have the
+            # old index memory-mapped keep reading a complete file
             index_file = self.index_path / "faiss_index.bin"
-            faiss.write_index(self.index, str(index_file))
+            tmp_index_file = index_file.with_suffix(".bin.tmp")
+            faiss.write_index(self.index, str(tmp_index_file))
             
             # Save metadata
-            metadata_file = self.index_path / "metadata.pkl"
-            with open(metadata_file, 'wb') as f:
-                pickle.dump(self.metadata, f)
+            metadata_file, tmp_metadata_file = self._write_metadata()
+            
+            os.replace(tmp_index_file, index_file)
+            os.replace(tmp_metadata_file, metadata_file)
+            self.text_store.save()
+            self._loaded_version = self._saved_version()
+            
+            # Don't leave the other format behind to be loaded by mistake later
+            for stale_file in (self.index_path / "metadata.parquet", self.index_path / "metadata.pkl"):
+                if stale_file != metadata_file and stale_file.exists():
+                    stale_file.unlink()
             
             logger.info(f"Saved index with {len(self.metadata)} documents")
             
         except Exception as e:
             logger.error(f"Failed to save index: {e}")
     
-    def add_documents(self, documents: List[Dict[str, Any]]):
-        """Add documents to the vector store."""
+    def _existing_metadata_file(self) -> Optional[Path]:
+        """Find the saved metadata, preferring parquet over the older pickle format."""
+        for name in ("metadata.parquet", "metadata.pkl"):
+            path = self.index_path / name
+            if path.exists() and (name.endswith(".pkl") or pq is not None):
+                return path
+        return None
+    
+    def _read_metadata(self, metadata_file: Path) -> List[Dict[str, Any]]:
+        """Load the metadata list from parquet or pickle."""
+        if metadata_file.suffix == ".parquet":
+            # Columns hold the union of all keys; drop the nulls rows never had
+            return [
+                {key: value for key, value in row.items() if value is not None}
+                for row in pq.read_table(metadata_file).to_pylist()
+            ]
+        
+        with open(metadata_file, 'rb') as f:
+            return pickle.load(f)
+    
+    def _write_metadata(self) -> Tuple[Path, Path]:
+        """Write the metadata to a temporary file, returning (final path, temporary path)."""
+        columns = dict.fromkeys(key for metadata in self.metadata for key in metadata)
+        # A table without columns can't record how many (empty) rows there are
+        if pa is not None and (columns or not self.metadata):
+            try:
+                table = pa.table({key: [metadata.get(key) for metadata in self.metadata] for key in columns})
+                metadata_file = self.index_path / "metadata.parquet"
+                tmp_metadata_file = metadata_file.with_suffix(".parquet.tmp")
+                pq.write_table(table, tmp_metadata_file, compression="zstd")
+                return metadata_file, tmp_metadata_file
+            except pa.ArrowException as e:
+                logger.warning(f"Metadata does not fit a columnar schema, pickling it instead: {e}")
+        
+        metadata_file = self.index_path / "metadata.pkl"
+        tmp_metadata_file = metadata_file.with_suffix(".pkl.tmp")
+        with open(tmp_metadata_file, 'wb') as f:
+            pickle.dump(self.metadata, f)
+        return metadata_file, tmp_metadata_file
+    
+    def add_documents(self, documents: List[Dict[str, Any]], save: bool = True):
+        """Add documents to the vector store (pass save=False when adding in batches)."""
         if not documents:
             logger.warning("No documents provided to add")
             return
         
         # Extract texts and metadata
         texts = []
+        hashes = []
         new_metadata = []
         
         for doc in documents:
             text = doc.get('text', '')
             if text.strip():
                 texts.append(text)
+                hashes.append(doc.get('content_hash') or content_hash(text))
                 new_metadata.append(doc.get('metadata', {}))
         
         if not texts:
             logger.warning("No valid texts found in documents")
             return
         
-        # Encode texts to vectors
-        logger.info(f"Encoding {len(texts)} documents...")
-        embeddings = self.encoder.encode(texts, show_progress_bar=True)
+        embeddings = self._embed_documents(texts, hashes)
+        
+        # Switch to an approximate index once the corpus outgrows exact search
+        index_kind = self._resolve_index_type(len(self.metadata) + len(texts))
+        if index_kind != self.index_kind or not self.index.is_trained:
+            self._rebuild_index(index_kind, embeddings)
+        else:
+            self._ensure_writable()
         
-        # Add to FAISS index
-        self.index.add(embeddings.astype('float32'))
+        # Add to FAISS index (embeddings are already unit-length float32)
+        self.index.add(embeddings)
+        if self._gpu_index is not None:
+            self._gpu_index.add(embeddings)
         
-        # Store metadata
+        # Store metadata and texts
+        self.text_store.append(texts, len(self.metadata))
         self.metadata.extend(new_metadata)
         
         # Save to disk
-        self._save_index()
+        if save:
+            self.save_index()
         
         logger.info(f"Added {len(texts)} documents to vector store")
     
-    def similarity_search(self, query: str, k: int = 5, threshold: float = 0.5) -> List[Dict[str, Any]]:
+    def embed_query(self, query: str) -> np.ndarray:
+        """Encode a single query into a (read-only) float32 embedding vector."""
+        # Whitespace differences don't change the embedding, so don't let them miss the cache
+        return self._embed_text(" ".join(query.split()))
+    
+    def _embed_text_uncached(self, text: str) -> np.ndarray:
+        """Encode one string; results are shared through the LRU cache, so they are frozen."""
+        embedding = _normalize_rows(self._encode([text]))[0]
+        embedding.setflags(write=False)
+        return embedding
+    
+    def similarity_search(self, query: str, k: int = 5, threshold: float = 0.5,
+                          query_embedding: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
         """Search for similar documents using cosine similarity."""
         if not query.strip():
             return []
         
-        # Encode query
-        query_embedding = self.encoder.encode([query])
+        # Encode query, unless the caller already has its embedding
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
         
         # Search in FAISS index
-        scores, indices = self.index.search(query_embedding.astype('float32'), k)
+        with self.state_lock:
+            scores, indices = self._search_index().search(np.ascontiguousarray(query_embedding, dtype=np.float32).reshape(1, -1), k)
+            return self._build_results(scores, indices, threshold)[0]
+    
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Encode several queries with one encoder call, one unit-length row per query.
+        
+        Repeated queries (up to whitespace) are encoded once; blank queries get a zero row.
+        """
+        keys = [" ".join(query.split()) for query in queries]
+        unique = [key for key in dict.fromkeys(keys) if key]
+        
+        if not unique:
+            return np.zeros((len(queries), self.dimension), dtype=np.float32)
+        
+        encoded = _normalize_rows(self._encode_sorted(unique, batch_size=64))
+        rows = {key: row for row, key in enumerate(unique)}
+        embeddings = np.zeros((len(queries), encoded.shape[1]), dtype=np.float32)
+        for i, key in enumerate(keys):
+            if key:
+                embeddings[i] = encoded[rows[key]]
+        
+        return embeddings
+    
+    def search_many(self, queries: List[str], k: int = 5, threshold: Optional[float] = 0.5,
+                    query_embeddings: Optional[np.ndarray] = None) -> List[List[Dict[str, Any]]]:
+        """Search several queries with one encoder call and one (matrix-matrix) FAISS search.
+        
+        Pass query_embeddings (one row per query, e.g. from embed_queries) to skip encoding.
+        """
+        if not queries:
+            return []
         
-        results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx < len(self.metadata) and score >= threshold:
-                result = {
-                    'score': float(score),
-                    'metadata': self.metadata[idx].copy(),
-                    'index': int(idx)
-                }
-                results.append(result)
+        # Repeated queries (up to whitespace) are searched once
+        keys = [" ".join(query.split()) for query in queries]
+        first = {}
+        for i, key in enumerate(keys):
+            if key:
+                first.setdefault(key, i)
         
-        # Sort by score (descending)
-        results.sort(key=lambda x: x['score'], reverse=True)
+        results_by_query = {}
+        if first:
+            if query_embeddings is None:
+                query_embeddings = self.embed_queries(queries)
+            unique_embeddings = np.ascontiguousarray(query_embeddings[list(first.values())], dtype=np.float32)
+            with self.state_lock:
+                scores, indices = self._search_index().search(unique_embeddings, k)
+                results_by_query = dict(zip(first, self._build_results(scores, indices, threshold)))
         
-        return results
+        return [list(results_by_query.get(key, [])) for key in keys]
     
-    def search_with_context(self, query: str, k: int = 5, threshold: float = 0.5) -> Tuple[str, List[Dict[str, Any]]]:
+    def _build_results(self, scores: np.ndarray, indices: np.ndarray,
+                       threshold: Optional[float]) -> List[List[Dict[str, Any]]]:
+        """Turn FAISS scores/ids (one row per query) into {'score', 'index'} dicts above the threshold.
+        
+        Metadata is not copied into results; look it up with get_metadata(result['index']).
+        """
+        # Filter in a compiled kernel; dicts are only built for the hits that survive
+        rows, hit_scores, hit_ids = filter_topk(scores, indices, threshold, len(self.metadata))
+        
+        all_results = [[] for _ in range(len(scores))]
+        for row, score, idx in zip(rows.tolist(), hit_scores.tolist(), hit_ids.tolist()):
+            all_results[row].append({'score': score, 'index': idx})
+        
+        # FAISS returns each row best-first and the filter keeps that order, so no sort
+        return all_results
+    
+    def search_with_context(self, query: str, k: int = 5, threshold: float = 0.5,
+                            query_embedding: Optional[np.ndarray] = None) -> Tuple[str, List[Dict[str, Any]]]:
         """Search and return context string with references."""
-        results = self.similarity_search(query, k, threshold)
+        if query_embedding is None and query.strip():
+            query_embedding = self.embed_query(query)
         
+        with self.state_lock:
+            results = self.similarity_search(query, k, threshold, query_embedding=query_embedding)
+            return self._build_context(results)
+    
+    def batch_search_with_context(self, queries: List[str], k: int = 5, threshold: float = 0.5,
+                                  query_embeddings: Optional[np.ndarray] = None) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        """Search for several queries at once and return a context/references pair for each."""
+        if query_embeddings is None:
+            query_embeddings = self.embed_queries(queries)
+        
+        with self.state_lock:
+            all_results = self.search_many(queries, k, threshold, query_embeddings=query_embeddings)
+            return [self._build_context(results) for results in all_results]
+    
+    def _build_context(self, results: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+        """Build the context string and references from search results."""
         if not results:
             return "", []
         
         # Build context string
         context_parts = []
         references = []
+        texts = self.text_store.get_many([result['index'] for result in results])
         
         for i, result in enumerate(results):
-            metadata = result['metadata']
+            metadata = self.get_metadata(result['index'])
             score = result['score']
             
             # Extract relevant information
@@ -175,65 +638,120 @@ class VectorStore:
             }
             references.append(ref)
             
-            # Add to context (we'll need to retrieve the actual text)
+            # Add to context, followed by the chunk text itself when it is stored
             context_parts.append(f"[Reference {i+1}] {title} - Page {page} (Relevance: {score:.3f})")
+            if texts[i]:
+                context_parts.append(texts[i])
         
         context = "\n".join(context_parts)
         return context, references
     
+    def get_metadata(self, index: int) -> Dict[str, Any]:
+        """Get the metadata stored for a document index.
+        
+        Returns the stored dict itself, not a copy: callers that modify it must copy it first.
+        Hold state_lock across the search and this call so both see the same index.
+        """
+        with self.state_lock:
+            return self.metadata[index]
+    
     def get_document_text(self, index: int) -> Optional[str]:
         """Get the original text for a document index."""
-        # This would need to be implemented based on how you store the original texts
-        # For now, we'll return None - you might want to store texts separately
-        return None
+        with self.state_lock:
+            return self.text_store.get(index)
     
-    def clear_index(self):
-        """Clear the entire index."""
-        self.index = faiss.IndexFlatIP(self.dimension)
+    def clear_index(self, save: bool = True):
+        """Clear the entire index (pass save=False to keep the saved one until the replacement is saved)."""
+        self.index_kind = self._resolve_index_type(0)
+        self.index = self._create_index(self.index_kind)
+        self._index_mmapped = False
         self.metadata = []
-        self._save_index()
+        self.text_store.clear()
+        if save:
+            self.save_index()
         logger.info("Cleared vector store index")
     
     def get_index_stats(self) -> Dict[str, Any]:
         """Get statistics about the vector store."""
-        return {
-            'total_documents': len(self.metadata),
-            'index_size': self.index.ntotal,
-            'dimension': self.dimension,
-            'model_name': self.model_name
-        }
+        with self.state_lock:
+            return {
+                'total_documents': len(self.metadata),
+                'index_size': self.index.ntotal,
+                'dimension': self.dimension,
+                'index_type': self.index_kind,
+                'model_name': self.model_name
+            }
     
     def update_documents(self, documents: List[Dict[str, Any]]):
         """Update documents in the vector store (clear and re-add)."""
         logger.info("Updating documents in vector store...")
-        self.clear_index()
+        self.clear_index(save=False)
         self.add_documents(documents)
     
-    def batch_similarity_search(self, queries: List[str], k: int = 5) -> List[List[Dict[str, Any]]]:
-        """Perform batch similarity search for multiple queries."""
-        if not queries:
-            return []
+    def _embed_documents(self, texts: List[str], hashes: List[str]) -> np.ndarray:
+        """Embed documents, reusing cached vectors and encoding only the rest."""
+        cached = self.embedding_cache.get_many(hashes) if self.embedding_cache is not None else {}
+        missing = [i for i, h in enumerate(hashes) if h not in cached]
+        
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for i, h in enumerate(hashes):
+            if h in cached:
+                embeddings[i] = cached[h]
         
-        # Encode all queries
-        query_embeddings = self.encoder.encode(queries)
-        
-        # Batch search
-        scores, indices = self.index.search(query_embeddings.astype('float32'), k)
-        
-        all_results = []
-        for query_scores, query_indices in zip(scores, indices):
-            query_results = []
-            for score, idx in zip(query_scores, query_indices):
-                if idx < len(self.metadata):
-                    result = {
-                        'score': float(score),
-                        'metadata': self.metadata[idx].copy(),
-                        'index': int(idx)
-                    }
-                    query_results.append(result)
+        if missing:
+            # Repeated chunks (intros, slide titles) are encoded once
+            first_rows = {}
+            for i in missing:
+                first_rows.setdefault(hashes[i], i)
+            unique_rows = np.fromiter(first_rows.values(), dtype=np.int64, count=len(first_rows))
             
-            # Sort by score
-            query_results.sort(key=lambda x: x['score'], reverse=True)
-            all_results.append(query_results)
+            # Encode texts to vectors, grouped by length to keep padding low, and
+            # scatter them straight into their rows instead of reordering a copy first
+            logger.info(f"Encoding {len(unique_rows)} documents "
+                        f"({len(missing) - len(unique_rows)} duplicates, {len(texts) - len(missing)} cached)...")
+            rows = unique_rows[_length_order([texts[i] for i in unique_rows])]
+            
+            # Encode in bounded chunks so the encoder never holds more than one chunk of
+            # output; each chunk is cached as it completes, so an interrupted run resumes
+            for start in range(0, len(rows), ENCODE_CHUNK_SIZE):
+                chunk_rows = rows[start:start + ENCODE_CHUNK_SIZE]
+                new_embeddings = self._encode([texts[i] for i in chunk_rows], batch_size=64, show_progress_bar=True)
+                embeddings[chunk_rows] = new_embeddings
+                
+                if self.embedding_cache is not None:
+                    self.embedding_cache.put_many([hashes[i] for i in chunk_rows], new_embeddings)
+            
+            # Duplicates copy the vector of the first row with the same text
+            duplicates = [i for i in missing if first_rows[hashes[i]] != i]
+            if duplicates:
+                embeddings[duplicates] = embeddings[[first_rows[hashes[i]] for i in duplicates]]
+        else:
+            logger.info(f"All {len(texts)} documents found in embedding cache")
+        
+        # Also covers cached vectors and encoders that ignore normalize_embeddings
+        return _normalize_rows(embeddings)
+    
+    def _encode(self, texts: List[str], show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        """Encode texts to unit-length embeddings without autograd bookkeeping.
+        
+        The progress bar is off unless asked for (indexing); sentence-transformers would
+        otherwise show one for every query whenever INFO logging is enabled.
+        """
+        with torch.inference_mode():
+            embeddings = self.encoder.encode(texts, convert_to_numpy=True, normalize_embeddings=True,
+                                             show_progress_bar=show_progress_bar, **kwargs)
         
-        return all_results 
\ No newline at end of file
+        # Already float32 from both encoders (no copy); converts half-precision GPU output
+        return np.asarray(embeddings, dtype=np.float32)
+    
+    def _encode_sorted(self, texts: List[str], batch_size: int = 64, **kwargs) -> np.ndarray:
+        """Encode texts grouped by length so each batch carries little padding."""
+        order = _length_order(texts)
+        embeddings = self._encode([texts[i] for i in order], batch_size=batch_size, **kwargs)
+        
+        # Restore the caller's order
+        return embeddings[np.argsort(order)]
+    
+    def batch_similarity_search(self, queries: List[str], k: int = 5, threshold: Optional[float] = None) -> List[List[Dict[str, Any]]]:
+        """Perform batch similarity search for multiple queries."""
+        return self.search_many(queries, k, threshold)
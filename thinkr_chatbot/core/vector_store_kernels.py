@@ -0,0 +1,55 @@
+"""
+Post-processing kernels for FAISS search results.
+
+Compiled with numba when it is installed; otherwise the same filtering is done
+with vectorized NumPy masks.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+def _filter_topk_numpy(scores: np.ndarray, indices: np.ndarray, threshold: float, n_valid: int):
+    """Keep hits with a valid id and a score of at least threshold, in search order."""
+    mask = (indices >= 0) & (indices < n_valid) & (scores >= threshold)
+    rows = np.nonzero(mask)[0]
+    return rows, scores[mask], indices[mask]
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _filter_topk_jit(scores, indices, threshold, n_valid):
+        """Keep hits with a valid id and a score of at least threshold, in search order."""
+        n_rows, k = scores.shape
+        rows = np.empty(n_rows * k, dtype=np.int64)
+        hit_scores = np.empty(n_rows * k, dtype=scores.dtype)
+        hit_ids = np.empty(n_rows * k, dtype=np.int64)
+        
+        count = 0
+        for row in range(n_rows):
+            for col in range(k):
+                idx = indices[row, col]
+                score = scores[row, col]
+                if idx >= 0 and idx < n_valid and score >= threshold:
+                    rows[count] = row
+                    hit_scores[count] = score
+                    hit_ids[count] = idx
+                    count += 1
+        
+        return rows[:count], hit_scores[:count], hit_ids[:count]
+
+
+def filter_topk(scores: np.ndarray, indices: np.ndarray, threshold, n_valid: int):
+    """Filter (n_queries, k) FAISS results to (rows, scores, ids) arrays of the hits to keep.
+    
+    A threshold of None keeps every hit with a valid id.
+    """
+    threshold = -np.inf if threshold is None else threshold
+    if NUMBA_AVAILABLE:
+        return _filter_topk_jit(scores, indices, np.float32(threshold), n_valid)
+    return _filter_topk_numpy(scores, indices, threshold, n_valid)
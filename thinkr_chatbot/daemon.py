@@ -0,0 +1,163 @@
+"""
+Local daemon that keeps one ThinkR chatbot loaded and answers CLI requests over a Unix socket.
+
+Each request is a single JSON line ``{"cmd": ..., "args": [...]}`` and gets a single
+JSON line back: ``{"ok": true, "result": ...}`` or ``{"ok": false, "error": ...}``.
+"""
+
+import os
+import json
+import stat
+import socket
+import logging
+import tempfile
+import socketserver
+from typing import Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _default_socket_path() -> str:
+    """Per-user socket path: $THINKR_SOCKET, else $XDG_RUNTIME_DIR, else a per-uid temp directory."""
+    if os.getenv("THINKR_SOCKET"):
+        return os.environ["THINKR_SOCKET"]
+    if os.getenv("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], "thinkr.sock")
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return os.path.join(tempfile.gettempdir(), f"thinkr-{uid}", "thinkr.sock")
+
+
+DEFAULT_SOCKET_PATH = _default_socket_path()
+
+# Commands the daemon accepts, mapped to the ThinkRChatbot method that serves them
+COMMANDS = {
+    "ask": "chat",
+    "recommend": "get_recommendations",
+}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Answer line-delimited JSON requests with the server's shared chatbot."""
+    
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                method = COMMANDS.get(request.get("cmd"))
+                if method is None:
+                    response = {"ok": False, "error": f"Unknown command: {request.get('cmd')}"}
+                else:
+                    result = getattr(self.server.chatbot, method)(*request.get("args", []))
+                    response = {"ok": True, "result": result}
+            except Exception as e:
+                logger.error(f"Error handling daemon request: {e}")
+                response = {"ok": False, "error": str(e)}
+            
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class ChatbotDaemon(socketserver.ThreadingUnixStreamServer):
+    """Threaded Unix socket server sharing a single chatbot between connections."""
+    
+    daemon_threads = True
+    
+    def __init__(self, socket_path: str, chatbot):
+        self.chatbot = chatbot
+        self.socket_path = socket_path
+        
+        _make_private_dir(os.path.dirname(socket_path) or ".")
+        _remove_stale_socket(socket_path)
+        
+        # Only the current user may connect
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+        self._socket_inode = os.stat(socket_path).st_ino
+    
+    def server_close(self):
+        super().server_close()
+        # Only remove the socket if it is still the one this daemon created
+        try:
+            if os.stat(self.socket_path).st_ino == self._socket_inode:
+                os.unlink(self.socket_path)
+        except (FileNotFoundError, AttributeError):
+            pass
+
+
+def _make_private_dir(path: str):
+    """Create the socket's directory for the current user only, and check an existing one."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    _check_socket_dir(path)
+
+
+def _check_socket_dir(path: str):
+    """Raise unless no other user can remove, replace or plant files in the socket's directory.
+    
+    That means a directory of ours without group/other permissions, or the shared temp
+    directory itself, whose sticky bit keeps others from touching our socket.
+    """
+    info = os.stat(path)
+    if stat.S_ISDIR(info.st_mode) and info.st_uid == os.getuid() and not info.st_mode & 0o077:
+        return
+    
+    shared_tmp = os.path.realpath(path) == os.path.realpath(tempfile.gettempdir())
+    if shared_tmp and info.st_mode & stat.S_ISVTX and info.st_uid in (0, os.getuid()):
+        return
+    
+    raise RuntimeError(f"Socket directory {path} must belong to you and be private (chmod 700)")
+
+
+def _remove_stale_socket(socket_path: str):
+    """Remove a socket left behind by a daemon that did not shut down cleanly.
+    
+    Refuses to remove anything that is not our socket, or a socket a daemon still listens on.
+    """
+    try:
+        info = os.lstat(socket_path)
+    except FileNotFoundError:
+        return
+    
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        raise RuntimeError(f"{socket_path} exists and is not a ThinkR daemon socket owned by you")
+    
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except ConnectionRefusedError:
+            os.unlink(socket_path)
+            return
+    raise RuntimeError(f"A ThinkR daemon is already listening on {socket_path}")
+
+
+def send_request(cmd: str, args: List[Any], socket_path: str = DEFAULT_SOCKET_PATH,
+                 timeout: float = 300) -> Optional[Any]:
+    """Send a command to a running daemon, returning None if no daemon is listening."""
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    
+    # Don't send questions to (or trust answers from) a socket another user created or can replace
+    try:
+        _check_socket_dir(os.path.dirname(socket_path) or ".")
+        owner = os.stat(socket_path).st_uid
+    except FileNotFoundError:
+        return None
+    if owner != os.getuid():
+        raise RuntimeError(f"Refusing to use {socket_path}: it belongs to another user")
+    
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            sock.sendall(json.dumps({"cmd": cmd, "args": args}).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as reader:
+                line = reader.readline()
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+    
+    response = json.loads(line)
+    if not response["ok"]:
+        raise RuntimeError(response["error"])
+    return response["result"]
@@ -5,6 +5,7 @@ Streamlit web interface for the ThinkR chatbot.
 import streamlit as st
 import os
 import json
+import threading
 from datetime import datetime
 from pathlib import Path
 import pandas as pd
@@ -59,47 +60,102 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+@st.cache_resource
+def get_shared_chatbot():
+    """Load the index and embedding model once per process; sessions get their own chatbot on top."""
+    return ThinkRChatbot()
+
+
+@st.cache_resource
+def get_index_lock():
+    """Lock that lets one session at a time refresh the shared index."""
+    return threading.Lock()
+
+
 def initialize_chatbot():
-    """Initialize the chatbot."""
+    """Initialize a chatbot with this session's own conversation history."""
     try:
-        return ThinkRChatbot()
+        return get_shared_chatbot().new_session()
     except Exception as e:
         st.error(f"Failed to initialize chatbot: {str(e)}")
         st.info("Please make sure you have set your OPENAI_API_KEY environment variable.")
         return None
 
 
+def refresh_index():
+    """Rebuild the index on a separate vector store, then load it into the shared one.
+    
+    Other sessions keep searching the shared index while it is rebuilt.
+    """
+    lock = get_index_lock()
+    if not lock.acquire(blocking=False):
+        return {"status": "warning", "message": "The index is already being refreshed"}
+    
+    try:
+        result = ThinkRChatbot(use_response_cache=False).update_index()
+        get_shared_chatbot().reload_index_if_changed()
+        return result
+    finally:
+        lock.release()
+
+
 def display_chat_message(role, content, references=None):
-    """Display a chat message with proper styling."""
+    """Build the styled HTML for a chat message and its course references."""
     if role == "user":
-        st.markdown(f"""
-        <div class="chat-message user-message">
-            <strong>You:</strong><br>
-            {content}
-        </div>
-        """, unsafe_allow_html=True)
+        parts = [f'<div class="chat-message user-message"><strong>You:</strong><br>{content}</div>']
     else:
-        st.markdown(f"""
-        <div class="chat-message assistant-message">
-            <strong>ThinkR Tutor:</strong><br>
-            {content}
-        </div>
-        """, unsafe_allow_html=True)
+        parts = [f'<div class="chat-message assistant-message"><strong>ThinkR Tutor:</strong><br>{content}</div>']
         
-        # Display references if available
+        # Add references if available
         if references:
-            st.markdown("**Course References:**")
+            parts.append('<p><strong>Course References:</strong></p>')
             for i, ref in enumerate(references, 1):
                 module = ref.get('module', 'Unknown Module')
                 page = ref.get('page', 'N/A')
                 score = ref.get('score', 0)
                 
-                st.markdown(f"""
-                <div class="reference-box">
-                    <strong>Reference {i}:</strong> {module}<br>
-                    <small>Page: {page} | Relevance: {score:.3f}</small>
-                </div>
-                """, unsafe_allow_html=True)
+                parts.append(
+                    f'<div class="reference-box"><strong>Reference {i}:</strong> {module}<br>'
+                    f'<small>Page: {page} | Relevance: {score:.3f}</small></div>'
+                )
+    
+    return "\n".join(parts)
+
+
+def display_chat_history(messages):
+    """Render the whole conversation with a single st.markdown call."""
+    if messages:
+        html = "\n".join(
+            display_chat_message(message["role"], message["content"], message.get("references"))
+            for message in messages
+        )
+        st.markdown(html, unsafe_allow_html=True)
+
+
+def answer_question(question, use_context, k_results):
+    """Ask the chatbot a question and add the exchange to this session's messages."""
+    st.session_state.messages.append({
+        "role": "user",
+        "content": question,
+        "timestamp": datetime.now().isoformat()
+    })
+    
+    with st.spinner("Thinking..."):
+        result = st.session_state.chatbot.chat(
+            question,
+            use_context=use_context,
+            k_results=k_results
+        )
+    
+    st.session_state.messages.append({
+        "role": "assistant",
+        "content": result["response"],
+        "references": result.get("references", []),
+        "timestamp": datetime.now().isoformat()
+    })
+    
+    # Rerun to display new messages
+    st.rerun()
 
 
 def main():
@@ -154,7 +210,8 @@ def main():
         # System info
         st.markdown('<h3 class="sidebar-header">📊 System Info</h3>', unsafe_allow_html=True)
         
-        if 'chatbot' not in st.session_state:
+        # The index is loaded once per process, the conversation is this session's own
+        if st.session_state.get("chatbot") is None:
             st.session_state.chatbot = initialize_chatbot()
         
         if st.session_state.chatbot:
@@ -169,7 +226,7 @@ def main():
             
             if st.button("🔄 Refresh Index"):
                 with st.spinner("Refreshing index..."):
-                    result = st.session_state.chatbot.update_index()
+                    result = refresh_index()
                     if result["status"] == "success":
                         st.success("Index refreshed successfully!")
                     else:
@@ -198,12 +255,7 @@ def main():
             st.session_state.messages = []
         
         # Display chat messages
-        for message in st.session_state.messages:
-            display_chat_message(
-                message["role"],
-                message["content"],
-                message.get("references")
-            )
+        display_chat_history(st.session_state.messages)
         
         # Chat input
         user_input = st.text_area(
@@ -217,31 +269,7 @@ def main():
         with col1:
             if st.button("🚀 Send", type="primary"):
                 if user_input.strip() and st.session_state.chatbot:
-                    # Add user message to chat
-                    st.session_state.messages.append({
-                        "role": "user",
-                        "content": user_input,
-                        "timestamp": datetime.now().isoformat()
-                    })
-                    
-                    # Get response
-                    with st.spinner("Thinking..."):
-                        result = st.session_state.chatbot.chat(
-                            user_input,
-                            use_context=use_context,
-                            k_results=k_results
-                        )
-                    
-                    # Add assistant response to chat
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": result["response"],
-                        "references": result.get("references", []),
-                        "timestamp": datetime.now().isoformat()
-                    })
-                    
-                    # Rerun to display new messages
-                    st.rerun()
+                    answer_question(user_input, use_context, k_results)
         
         with col2:
             if st.button("💡 Get Recommendations"):
@@ -272,28 +300,8 @@ def main():
         ]
         
         for question in quick_questions:
-            if st.button(question, key=f"quick_{question}"):
-                st.session_state.messages.append({
-                    "role": "user",
-                    "content": question,
-                    "timestamp": datetime.now().isoformat()
-                })
-                
-                with st.spinner("Thinking..."):
-                    result = st.session_state.chatbot.chat(
-                        question,
-                        use_context=use_context,
-                        k_results=k_results
-                    )
-                
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": result["response"],
-                    "references": result.get("references", []),
-                    "timestamp": datetime.now().isoformat()
-                })
-                
-                st.rerun()
+            if st.button(question, key=f"quick_{question}") and st.session_state.chatbot:
+                answer_question(question, use_context, k_results)
         
         # System statistics
         if st.session_state.chatbot: